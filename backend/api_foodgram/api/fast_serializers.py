@@ -0,0 +1,127 @@
+"""
+Сериализаторы только для чтения без механики полей DRF.
+
+Строят словари напрямую из аннотаций и prefetch-кэшей queryset'а
+вьюсета. Формат ответа совпадает с RecipeSerializer
+и IngredientSerializer.
+"""
+from abc import ABC, abstractmethod
+
+from core.metrics import timer
+from core.services import subscribed_author_ids
+
+
+class FastSerializer(ABC):
+    """
+    Минимальный интерфейс сериализатора DRF: instance, many, context
+    и свойство data.
+    """
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @property
+    def data(self):
+        with timer('serialize'):
+            if self.many:
+                return [
+                    self.to_representation(obj) for obj in self.instance
+                ]
+            return self.to_representation(self.instance)
+
+    @abstractmethod
+    def to_representation(self, instance):
+        """
+        Словарь с представлением одного объекта.
+        """
+
+
+class FastIngredientSerializer(FastSerializer):
+    def to_representation(self, ingredient):
+        return {
+            'id': ingredient.id,
+            'name': ingredient.name,
+            'measurement_unit': ingredient.measurement_unit,
+        }
+
+
+class FastRecipeSerializer(FastSerializer):
+    """
+    Ожидает queryset RecipeViewSet.get_queryset(): автор через
+    select_related, тэги и ингредиенты через prefetch_related,
+    is_favorited и is_in_shopping_cart - аннотации.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.request = self.context.get('request')
+        self.tags = {}
+        self._subscriptions = None
+
+    @property
+    def subscriptions(self) -> set:
+        if self._subscriptions is None:
+            recipes = self.instance if self.many else (self.instance,)
+            self._subscriptions = subscribed_author_ids(
+                self.request.user,
+                {recipe.author_id for recipe in recipes},
+            )
+        return self._subscriptions
+
+    def image_url(self, image):
+        if not image:
+            return None
+        if self.request is None:
+            return image.url
+        return self.request.build_absolute_uri(image.url)
+
+    def author(self, author):
+        if author is None:
+            return None
+        user = self.request.user
+        return {
+            'id': author.id,
+            'email': author.email,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'is_subscribed': (
+                author.id != user.id and author.id in self.subscriptions
+            ),
+        }
+
+    def tag(self, tag):
+        # Тэгов мало, один и тот же словарь переиспользуется.
+        data = self.tags.get(tag.id)
+        if data is None:
+            data = self.tags[tag.id] = {
+                'id': tag.id,
+                'name': tag.name,
+                'color': tag.color,
+                'slug': tag.slug,
+            }
+        return data
+
+    def to_representation(self, recipe):
+        return {
+            'id': recipe.id,
+            'tags': [self.tag(tag) for tag in recipe.tags.all()],
+            'name': recipe.name,
+            'text': recipe.text,
+            'image': self.image_url(recipe.image),
+            'author': self.author(recipe.author),
+            'ingredients': [
+                {
+                    'id': amount.ingredient.id,
+                    'name': amount.ingredient.name,
+                    'measurement_unit': amount.ingredient.measurement_unit,
+                    'amount': amount.amount,
+                }
+                for amount in recipe.ingredients.all()
+            ],
+            'cooking_time': recipe.cooking_time,
+            'is_favorited': getattr(recipe, 'is_favorited', False),
+            'is_in_shopping_cart': getattr(
+                recipe, 'is_in_shopping_cart', False
+            ),
+        }
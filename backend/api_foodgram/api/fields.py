@@ -0,0 +1,118 @@
+import binascii
+from base64 import b64decode
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from uuid import uuid4
+from weakref import finalize
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, UnidentifiedImageError
+from rest_framework.fields import ImageField, SkipField
+
+
+class Base64Upload(UploadedFile):
+    """
+    Временный файл для декодированного изображения. Хранилище
+    переносит его на место без копирования, а если файл так и не был
+    сохранён, он удаляется вместе с объектом.
+    """
+    def __init__(self):
+        file = NamedTemporaryFile(
+            suffix='.upload',
+            dir=settings.FILE_UPLOAD_TEMP_DIR,
+            delete=False,
+        )
+        super().__init__(file, 'upload', None, 0, None)
+        finalize(self, Path(file.name).unlink, missing_ok=True)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class Base64ImageField(ImageField):
+    """
+    Изображение в формате data:image/...;base64,...
+
+    Строка декодируется порциями прямо во временный файл, поэтому
+    в памяти не оказываются одновременно base64, байты и картинка.
+    Размер проверяется по длине строки до декодирования, разрешение -
+    по заголовку файла до чтения пикселей.
+
+    При изменении рецепта то же изображение (ссылка на текущий файл
+    или те же байты по sha256) пропускается, чтобы не обрабатывать
+    его заново.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Изображение должно быть передано в base64.',
+        'too_large': 'Размер изображения больше {max_size} байт.',
+        'too_many_pixels': 'Разрешение изображения больше {max_pixels} px.',
+        'invalid_format': 'Формат изображения не поддерживается.',
+    }
+    allowed_formats = ('JPEG', 'PNG', 'GIF', 'WEBP')
+    digest_source = 'image_digest'
+
+    def to_internal_value(self, data):
+        instance = getattr(self.parent, 'instance', None)
+        current = getattr(instance, self.source, None)
+        if (
+            current and isinstance(data, str)
+            and data.endswith(current.url)
+        ):
+            raise SkipField()
+        if not isinstance(data, str) or ';base64,' not in data:
+            self.fail('invalid_base64')
+        payload = data.partition(';base64,')[2]
+
+        max_size = settings.MAX_IMAGE_UPLOAD_SIZE
+        if len(payload) // 4 * 3 > max_size:
+            self.fail('too_large', max_size=max_size)
+
+        upload = Base64Upload()
+        try:
+            self.decode_to(upload, payload)
+            image_format = self.check_image(upload)
+        except Exception:
+            upload.close()
+            raise
+
+        digest = getattr(instance, self.digest_source, None)
+        if digest and digest == upload.digest:
+            upload.close()
+            raise SkipField()
+
+        upload.name = f'{uuid4()}.{image_format.lower()}'
+        upload.content_type = Image.MIME[image_format]
+        return super().to_internal_value(upload)
+
+    def decode_to(self, upload, payload):
+        chunk_size = settings.BASE64_CHUNK_SIZE
+        digest = sha256()
+        try:
+            for start in range(0, len(payload), chunk_size):
+                chunk = b64decode(
+                    payload[start:start + chunk_size], validate=True
+                )
+                digest.update(chunk)
+                upload.write(chunk)
+        except (binascii.Error, ValueError):
+            self.fail('invalid_base64')
+        upload.digest = digest.hexdigest()
+        upload.size = upload.tell()
+        upload.seek(0)
+
+    def check_image(self, upload):
+        try:
+            with Image.open(upload.temporary_file_path()) as image:
+                width, height = image.size
+                image_format = image.format
+        except (UnidentifiedImageError, Image.DecompressionBombError):
+            self.fail('invalid_format')
+
+        if image_format not in self.allowed_formats:
+            self.fail('invalid_format')
+        max_pixels = settings.MAX_IMAGE_PIXELS
+        if width * height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        return image_format
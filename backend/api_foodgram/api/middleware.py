@@ -0,0 +1,74 @@
+import json
+import logging
+from random import random
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from core.metrics import RequestMetrics, current_metrics, metrics_registry
+
+logger = logging.getLogger('api.metrics')
+
+
+class RequestMetricsMiddleware:
+    """
+    Число и время SQL-запросов, время сериализации и рендеринга,
+    размер ответа для доли REQUEST_METRICS_SAMPLE_RATE запросов к API.
+
+    Результат отдаётся в заголовке Server-Timing, пишется строкой JSON
+    в лог api.metrics и накапливается для /api/metrics/.
+    При REQUEST_METRICS_ENABLED = False middleware отключается
+    при старте и не участвует в обработке запросов.
+    """
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+
+    def __call__(self, request):
+        if (
+            not request.path.startswith('/api/')
+            or random() >= self.sample_rate
+        ):
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+            metrics.stop()
+        self.report(request, response, metrics)
+        return response
+
+    def report(self, request, response, metrics):
+        size = None if response.streaming else len(response.content)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{metrics.queries} queries"',
+            f'serialize;dur={metrics.timings["serialize"] * 1000:.1f}',
+            f'render;dur={metrics.timings["render"] * 1000:.1f}',
+            f'total;dur={metrics.duration * 1000:.1f}',
+        ))
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics_registry.record(
+            (request.method, view, response.status_code), metrics, size or 0
+        )
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'serialize_ms': round(metrics.timings['serialize'] * 1000, 2),
+            'render_ms': round(metrics.timings['render'] * 1000, 2),
+            'total_ms': round(metrics.duration * 1000, 2),
+            'bytes': size,
+        }))
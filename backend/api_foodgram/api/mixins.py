@@ -0,0 +1,113 @@
+from urllib.parse import urlencode
+
+from django.http import HttpResponse, HttpResponseNotModified
+
+from api.renderers import FastJSONRenderer
+from core.cache import recipe_cache, reference_cache
+
+
+def normalized_key(request) -> str:
+    query = sorted(request.query_params.lists())
+    return f'{request.path}?{urlencode(query, doseq=True)}'
+
+
+def etag_matches(request, etag: str) -> bool:
+    """
+    Есть ли etag среди тегов If-None-Match (слабое сравнение).
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return '*' in tags or etag in tags
+
+
+class ReferenceCacheMixin:
+    """
+    Отдаёт list/retrieve из версионного кэша готовых JSON-ответов
+    и поддерживает условные запросы по ETag.
+    """
+    cache_section = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+    def cached_response(self, request, respond, *args, **kwargs):
+        key = normalized_key(request)
+        entry = reference_cache.get(self.cache_section, key)
+        if entry is None:
+            response = respond(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = reference_cache.set(
+                self.cache_section,
+                key,
+                FastJSONRenderer().render(response.data),
+            )
+
+        etag, body = entry
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class AnonymousCacheMixin:
+    """
+    Отдаёт list/retrieve анонимным пользователям из recipe_cache:
+    для них ответ не зависит от пользователя. Разделы, от которых
+    зависит ответ, возвращает cache_dependencies() вьюсета.
+    """
+    def list(self, request, *args, **kwargs):
+        return self.anonymous_response(
+            request, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.anonymous_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+    def cache_dependencies(self, request):
+        return ('recipes',)
+
+    def anonymous_response(self, request, respond, *args, **kwargs):
+        if (
+            not request.user.is_anonymous
+            or request.accepted_renderer.format != 'json'
+        ):
+            return respond(request, *args, **kwargs)
+
+        uncached = []
+
+        def render():
+            response = respond(request, *args, **kwargs)
+            if response.status_code != 200:
+                uncached.append(response)
+                return None
+            return FastJSONRenderer().render(response.data)
+
+        etag, body, outcome = recipe_cache.get_or_render(
+            f'{request.get_host()}{normalized_key(request)}',
+            self.cache_dependencies(request),
+            render,
+        )
+        if body is None:
+            return uncached[0]
+
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['X-Cache'] = outcome.upper()
+        return response
@@ -1,6 +1,125 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from core.enums import Tuples
 
 
 class CustomPagination(PageNumberPagination):
     page_size = settings.PAGE_NUMBER
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class KeysetPagination(CustomPagination):
+    """
+    Постраничный вывод по номеру страницы или, если передан ?cursor=,
+    по ключу сортировки (например, (pub_date, id)).
+
+    В режиме курсора следующая страница выбирается условием
+    «строго после последней записи», поэтому глубокие страницы
+    стоят столько же, сколько первая. Общее количество считается
+    только по запросу ?count=1. Если вьюсет не задаёт ключ
+    (keyset_ordering = None), курсор игнорируется.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if self.cursor_query_param not in request.query_params or not ordering:
+            self.cursor_mode = False
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_mode = True
+        self.request = request
+        self.ordering = ordering
+        page_size = self.get_page_size(request)
+
+        self.count = None
+        if request.query_params.get(
+            self.count_query_param
+        ) in Tuples.SYMBOL_TRUE_SEARCH:
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(self.after(cursor))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:page_size + 1])
+        self.page = results[:page_size]
+        self.has_next = len(results) > page_size
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        response = {
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        }
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def after(self, cursor):
+        """
+        Условие «запись идёт после курсора» для составного ключа:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, cursor):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def encode_cursor(self, instance):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value
+            )
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
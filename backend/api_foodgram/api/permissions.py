@@ -38,7 +38,8 @@ class AdminOrReadOnly(BanPermission):
     def has_object_permission(
         self,
         request: WSGIRequest,
-        view
+        view,
+        obj: Model
     ) -> bool:
         return (
             request.method in SAFE_METHODS
@@ -0,0 +1,66 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.metrics import timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class PassthroughRenderer(BaseRenderer):
+    """
+    Рендерер для выбора формата файла через ?format=...
+    Тело ответа формируется во view, здесь оно не изменяется.
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data or b''
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson, если он установлен. Вывод совпадает
+    со стандартным компактным JSON; отступы (?indent, Browsable API)
+    по-прежнему формирует JSONRenderer.
+    """
+    default = staticmethod(JSONEncoder().default)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timer('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if (
+            orjson is None
+            or data is None
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        # Ошибки ListField и DictField DRF используют ключи-числа.
+        return orjson.dumps(
+            data, default=self.default, option=orjson.OPT_NON_STR_KEYS
+        ).replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace(
+            '\u2029'.encode(), b'\\u2029'
+        )
+
+
+class TxtRenderer(PassthroughRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CsvRenderer(PassthroughRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PdfRenderer(PassthroughRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
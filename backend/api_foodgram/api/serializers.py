@@ -1,16 +1,41 @@
+from collections.abc import Iterable
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
 from rest_framework.serializers import (
     ModelSerializer, SerializerMethodField,
-    IntegerField, ReadOnlyField,
+    IntegerField, ListField, ReadOnlyField, Serializer,
 )
 
-from core.services import recipe_ingredients_set
+from api.fields import Base64ImageField
+from core.metrics import timer
+from core.services import recipe_ingredients_set, subscribed_author_ids
 from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
 from users.models import User
 
 
-class UserWithSubscriptionSerializer(ModelSerializer):
+def page_author_ids(instance) -> set:
+    """
+    id авторов объектов ответа: рецептов или самих пользователей.
+    """
+    objects = instance if isinstance(instance, Iterable) else (instance,)
+    return {
+        obj.author_id if isinstance(obj, Recipe) else obj.pk
+        for obj in objects
+    }
+
+
+class TimedModelSerializer(ModelSerializer):
+    """
+    ModelSerializer, время вывода которого попадает в метрики запроса.
+    """
+    def to_representation(self, instance):
+        with timer('serialize'):
+            return super().to_representation(instance)
+
+
+class UserWithSubscriptionSerializer(TimedModelSerializer):
     is_subscribed = SerializerMethodField()
 
     class Meta:
@@ -30,10 +55,17 @@ class UserWithSubscriptionSerializer(ModelSerializer):
         user = self.context.get('view').request.user
         if user.is_anonymous or (user == obj):
             return False
-        return user.subscriptions.filter(author=obj).exists()
+        # Контекст общий для всех вложенных сериализаторов ответа,
+        # поэтому подписки на авторов страницы загружаются одним запросом.
+        checked, subscribed = self.context.get('subscriptions', ((), ()))
+        if obj.id not in checked:
+            checked = page_author_ids(self.root.instance) | {obj.id}
+            subscribed = subscribed_author_ids(user, checked)
+            self.context['subscriptions'] = checked, subscribed
+        return obj.id in subscribed
 
 
-class OptimizedRecipeSerializer(ModelSerializer):
+class OptimizedRecipeSerializer(TimedModelSerializer):
     """
     Оптимизированная версия сериализатора для списка рецептов.
     """
@@ -43,21 +75,21 @@ class OptimizedRecipeSerializer(ModelSerializer):
         read_only_fields = '__all__',
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
         read_only_fields = '__all__',
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedModelSerializer):
     class Meta:
         model = Ingredient
         fields = '__all__'
         read_only_fields = '__all__',
 
 
-class AmountIngredientSerializer(ModelSerializer):
+class AmountIngredientSerializer(TimedModelSerializer):
     id = IntegerField(source="ingredient.id")
     name = ReadOnlyField(source="ingredient.name")
     measurement_unit = ReadOnlyField(
@@ -74,7 +106,7 @@ class AmountIngredientSerializer(ModelSerializer):
         )
 
 
-class RecipeSerializer(ModelSerializer):
+class RecipeSerializer(TimedModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = UserWithSubscriptionSerializer(read_only=True)
     ingredients = AmountIngredientSerializer(
@@ -100,12 +132,16 @@ class RecipeSerializer(ModelSerializer):
         )
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context.get('view').request.user
         if user.is_authenticated:
             return recipe.in_favorites.filter(user=user).exists()
         return False
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         user = self.context.get('view').request.user
         if user.is_authenticated:
             return recipe.in_carts.filter(user=user).exists()
@@ -123,22 +159,24 @@ class RecipeSerializer(ModelSerializer):
             raise ValidationError('Указан несуществующий тэг')
         valid_ings = {}
         for ing in ingredients:
-            if not (isinstance(ing['amount'], int) or ing['amount'].isdigit()):
+            try:
+                ing_id, amount = int(ing['id']), int(ing['amount'])
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError('Неправильные ингидиенты')
+            if amount < settings.MIN_AMOUNT_INGREDIENTS:
                 raise ValidationError('Неправильное количество ингидиента')
+            valid_ings[ing_id] = valid_ings.get(ing_id, 0) + amount
 
-            amount = valid_ings.get(ing['id'], 0) + int(ing['amount'])
-            valid_ings[ing['id']] = amount
-
-        if not valid_ings:
-            raise ValidationError('Неправильные ингидиенты')
+        # Все ингредиенты загружаются одним запросом; список, в котором
+        # есть хотя бы один несуществующий, отклоняется целиком.
+        db_ings = Ingredient.objects.in_bulk(valid_ings.keys())
+        if len(db_ings) != len(valid_ings):
+            raise ValidationError('Указан несуществующий ингредиент')
 
-        db_ings = Ingredient.objects.filter(pk__in=valid_ings.keys())
-
-        if not db_ings:
-            raise ValidationError('Неправильные ингидиенты')
-
-        for ing in db_ings:
-            valid_ings[ing.pk] = (ing, valid_ings[ing.pk])
+        valid_ings = {
+            ing_id: (db_ings[ing_id], amount)
+            for ing_id, amount in valid_ings.items()
+        }
 
         data.update({
             'tags': tags_ids,
@@ -147,37 +185,47 @@ class RecipeSerializer(ModelSerializer):
         })
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        validated_data['image_digest'] = validated_data['image'].digest
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        recipe_ingredients_set(recipe, ingredients)
+        recipe_ingredients_set(recipe, ingredients, created=True)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
+        """
+        Записывает только изменения: поля рецепта, которые отличаются,
+        добавленные и удалённые тэги, изменённые ингредиенты.
+        """
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-
-        for key, value in validated_data.items():
-            if hasattr(recipe, key):
-                setattr(recipe, key, value)
+        if 'image' in validated_data:
+            validated_data['image_digest'] = validated_data['image'].digest
+
+        changed_fields = [
+            key for key, value in validated_data.items()
+            if hasattr(recipe, key) and getattr(recipe, key) != value
+        ]
+        for key in changed_fields:
+            setattr(recipe, key, validated_data[key])
+        if changed_fields:
+            recipe.save(update_fields=changed_fields)
 
         if tags:
-            recipe.tags.clear()
             recipe.tags.set(tags)
 
         if ingredients:
-            AmountIngredient.objects.filter(recipe=recipe)
             recipe_ingredients_set(recipe, ingredients)
 
-        recipe.save()
         return recipe
 
 
 class SubscriptionSerializer(UserWithSubscriptionSerializer):
-    recipes = OptimizedRecipeSerializer(many=True, read_only=True)
-    recipes_count = SerializerMethodField()
+    recipes = SerializerMethodField()
 
     class Meta:
         model = User
@@ -196,5 +244,27 @@ class SubscriptionSerializer(UserWithSubscriptionSerializer):
     def get_is_subscribed(*args):
         return True
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+    def get_recipes(self, obj):
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit:
+                recipes = recipes[:recipes_limit]
+        return OptimizedRecipeSerializer(
+            recipes, many=True, context=self.context
+        ).data
+
+
+class BulkIdsSerializer(Serializer):
+    """
+    Список id для пакетных операций: {"ids": [1, 2, 3]}.
+    """
+    ids = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.MAX_BULK_SIZE,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
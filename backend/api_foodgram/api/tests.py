@@ -0,0 +1,670 @@
+import base64
+import json
+import tempfile
+from io import BytesIO
+from threading import Barrier, Thread
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.serializers import TagSerializer
+from core.cache import ResponseCache, recipe_cache
+from core.filters import RecipeFilter
+from core.matching import RecipeMatcher
+from core.metrics import RequestMetrics, current_metrics, timer
+from core.search import recipe_index
+from recipes.models import (AmountIngredient, CartIngredient, Favorite,
+                            Ingredient, Recipe, ShoppingCart, Tag)
+from users.models import Subscriptions, User
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
+}
+
+
+class IsolatedCachesMixin:
+    """
+    Очищает кэши перед тестом: данные TestCase не коммитятся,
+    поэтому версии справочников не увеличиваются между тестами.
+    """
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        super().setUp()
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}',
+        email=f'user{number}@example.com',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='password12345',
+    )
+
+
+def create_recipes(authors, tags, ingredients, count, name='Рецепт'):
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            name=f'{name} {number}',
+            author=authors[number % len(authors)],
+            text='Описание',
+            image='recipe_images/test.png',
+            cooking_time=10,
+        )
+        recipe.tags.set(tags)
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in ingredients
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeListQueriesTest(IsolatedCachesMixin, TestCase):
+    """
+    Число запросов списка рецептов не зависит от размера страницы.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [create_user(number) for number in range(3)]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'тэг {number}', color=f'#00000{number}',
+                slug=f'tag{number}',
+            )
+            for number in range(2)
+        ]
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        cls.recipes = create_recipes(
+            cls.users, cls.tags, cls.ingredients, 20
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        # count, рецепты с флагами, тэги, ингредиенты рецептов,
+        # сами ингредиенты, подписки на авторов страницы.
+        for limit in (1, 5, 20):
+            with self.subTest(limit=limit), self.assertNumQueries(6):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkRelationValidationTest(IsolatedCachesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_invalid_ids_return_400(self):
+        # Ошибки элементов списка приходят с ключами-числами.
+        for url in (
+            '/api/recipes/shopping_cart/',
+            '/api/recipes/favorite/',
+            '/api/users/subscribe/',
+        ):
+            with self.subTest(url=url):
+                response = self.client.post(
+                    url, {'ids': ['x']}, format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('0', response.json()['ids'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeTagFilterTest(IsolatedCachesMixin, TestCase):
+    """
+    Фильтр по нескольким тэгам - полусоединение EXISTS без DISTINCT.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.tags = [
+            Tag.objects.create(
+                name=f'тэг {number}', color=f'#00000{number}',
+                slug=f'tag{number}',
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name='ингредиент', measurement_unit='г')
+        ]
+        cls.both = create_recipes([cls.user], cls.tags[:2], ingredients, 3)
+        cls.other = create_recipes(
+            [cls.user], cls.tags[2:], ingredients, 1, name='Другой рецепт'
+        )
+
+    def filter_queryset(self, data):
+        request = Request(APIRequestFactory().get('/api/recipes/', data))
+        request.user = self.user
+        filterset = RecipeFilter(
+            request.query_params, queryset=Recipe.objects.all(),
+            request=request,
+        )
+        self.assertTrue(filterset.is_valid(), filterset.errors)
+        return filterset.qs
+
+    def test_multiple_tags_without_distinct_or_duplicates(self):
+        queryset = self.filter_queryset({'tags': ['tag0', 'tag1']})
+        self.assertNotIn('DISTINCT', str(queryset.query))
+        ids = list(queryset.values_list('id', flat=True))
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), {recipe.id for recipe in self.both})
+
+    def test_api_returns_each_recipe_once(self):
+        response = APIClient().get(
+            '/api/recipes/', {'tags': ['tag0', 'tag1', 'tag2']}
+        )
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.json()['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(response.json()['count'], 4)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CounterCascadeTest(IsolatedCachesMixin, TestCase):
+    """
+    Удаление пользователя пересчитывает счётчики рецептов и авторов,
+    строки которых ушли каскадом.
+    """
+    def test_user_delete_recounts(self):
+        author, user, other = (create_user(number) for number in range(3))
+        ingredients = [
+            Ingredient.objects.create(name='ингредиент', measurement_unit='г')
+        ]
+        recipe, = create_recipes([author], [], ingredients, 1)
+        for follower in (user, other):
+            client = APIClient()
+            client.force_authenticate(follower)
+            client.post(f'/api/recipes/{recipe.id}/favorite/')
+            client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+            client.post(f'/api/users/{author.id}/subscribe/')
+
+        user.delete()
+
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.carts_count, 1)
+        self.assertEqual(author.subscribers_count, 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ToggleConcurrencyTest(IsolatedCachesMixin, TransactionTestCase):
+    """
+    Одинаковые параллельные запросы добавления и удаления: связь
+    меняется один раз, ответы - один 201/204 и остальные 400,
+    счётчики и итоги списка покупок сходятся.
+    """
+    threads = 8
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite в памяти не допускает параллельной записи')
+        self.user, self.author = create_user(0), create_user(1)
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        self.recipe, = create_recipes([self.author], [], ingredients, 1)
+
+    def concurrently(self, method, url):
+        barrier = Barrier(self.threads)
+        statuses = []
+
+        def request():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                statuses.append(getattr(client, method)(url).status_code)
+            except Exception as error:
+                statuses.append(repr(error))
+            finally:
+                connection.close()
+
+        threads = [Thread(target=request) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def assert_toggle(self, url, model, lookup, counter_owner, counter):
+        self.assertEqual(
+            self.concurrently('post', url),
+            [201] + [400] * (self.threads - 1),
+        )
+        self.assertEqual(model.objects.filter(**lookup).count(), 1)
+        counter_owner.refresh_from_db()
+        self.assertEqual(getattr(counter_owner, counter), 1)
+
+        self.assertEqual(
+            self.concurrently('delete', url),
+            [204] + [400] * (self.threads - 1),
+        )
+        self.assertFalse(model.objects.filter(**lookup).exists())
+        counter_owner.refresh_from_db()
+        self.assertEqual(getattr(counter_owner, counter), 0)
+
+    def test_favorite(self):
+        self.assert_toggle(
+            f'/api/recipes/{self.recipe.id}/favorite/', Favorite,
+            {'user': self.user, 'recipe': self.recipe},
+            self.recipe, 'favorites_count',
+        )
+
+    def test_shopping_cart(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        self.concurrently('post', url)
+        self.assertEqual(
+            dict(CartIngredient.objects.filter(user=self.user).values_list(
+                'ingredient_id', 'amount'
+            )),
+            dict(self.recipe.ingredients.values_list(
+                'ingredient_id', 'amount'
+            )),
+        )
+        self.assertEqual(
+            self.concurrently('delete', url)[0], 204
+        )
+        self.assertFalse(
+            CartIngredient.objects.filter(user=self.user).exists()
+        )
+        self.assert_toggle(
+            url, ShoppingCart, {'user': self.user, 'recipe': self.recipe},
+            self.recipe, 'carts_count',
+        )
+
+    def test_subscribe(self):
+        self.assert_toggle(
+            f'/api/users/{self.author.id}/subscribe/', Subscriptions,
+            {'user': self.user, 'author': self.author},
+            self.author, 'subscribers_count',
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogImportTest(IsolatedCachesMixin, TestCase):
+    url = '/api/recipes/catalog/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user(0)
+        cls.admin.is_staff = True
+        cls.admin.save()
+        Tag.objects.create(name='завтрак', color='#000001', slug='breakfast')
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post_lines(self, *lines):
+        return self.client.post(
+            self.url,
+            data='\n'.join(
+                line if isinstance(line, str) else json.dumps(line)
+                for line in lines
+            ).encode(),
+            content_type='application/x-ndjson',
+        )
+
+    def recipe_line(self, name):
+        return {
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'author': self.admin.email,
+            'image': 'recipe_images/test.png',
+            'tags': ['breakfast'],
+            'ingredients': [
+                {'name': 'мука', 'measurement_unit': 'г', 'amount': 100},
+            ],
+        }
+
+    def test_nothing_imported_returns_400(self):
+        response = self.post_lines('не json', {'name': 'Без полей'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+        self.assertEqual(
+            [error['line'] for error in response.json()['errors']], [1, 2]
+        )
+
+    def test_partial_import_returns_201(self):
+        response = self.post_lines(self.recipe_line('Блины'), 'не json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(len(response.json()['errors']), 1)
+
+
+def image_base64():
+    buffer = BytesIO()
+    Image.new('RGB', (10, 10), 'red').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeWriteQueriesTest(IsolatedCachesMixin, TestCase):
+    """
+    Создание и изменение рецепта - постоянное число запросов
+    при любом количестве ингредиентов.
+    """
+    counts = (1, 10, 50)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.tag = Tag.objects.create(
+            name='завтрак', color='#000001', slug='breakfast'
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(100)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def payload(self, name, ingredients, amount):
+        return {
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image_base64(),
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_create_queries_do_not_depend_on_ingredients(self):
+        for count in self.counts:
+            with self.subTest(count=count), self.assertNumQueries(15):
+                response = self.client.post(
+                    '/api/recipes/',
+                    self.payload(
+                        f'Рецепт {count}', self.ingredients[:count], 5
+                    ),
+                    format='json',
+                )
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.json()['ingredients']), count)
+
+    def test_update_queries_do_not_depend_on_ingredients(self):
+        for count in self.counts:
+            recipe, = create_recipes(
+                [self.user], [self.tag], self.ingredients[:count + 1], 1,
+                name=f'Рецепт {count}',
+            )
+            # Один ингредиент удаляется, один добавляется,
+            # у остальных меняется количество.
+            ingredients = self.ingredients[1:count + 2]
+            with self.subTest(count=count), self.assertNumQueries(18):
+                response = self.client.patch(
+                    f'/api/recipes/{recipe.id}/',
+                    self.payload(recipe.name, ingredients, 7),
+                    format='json',
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                {item['id'] for item in response.json()['ingredients']},
+                {ingredient.id for ingredient in ingredients},
+            )
+
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=tempfile.mkdtemp())
+class ResponseCacheInvalidationTest(IsolatedCachesMixin, TestCase):
+    """
+    Кэш ответов анонимным пользователям сбрасывается после коммита.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.tag = Tag.objects.create(
+            name='завтрак', color='#000001', slug='breakfast'
+        )
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipes = create_recipes([cls.user], [cls.tag], [ingredient], 2)
+
+    def setUp(self):
+        super().setUp()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def anonymous_ids(self, url):
+        response = self.anonymous.get(url)
+        return response['X-Cache'], [
+            recipe['id'] for recipe in response.json()['results']
+        ]
+
+    def test_recipe_delete_bumps_generations_on_commit(self):
+        recipe = self.recipes[0]
+        self.assertIn(recipe.id, self.anonymous_ids('/api/recipes/')[1])
+        dependencies = (
+            'recipes', f'recipe:{recipe.id}', f'tag:{self.tag.id}'
+        )
+        generations = recipe_cache.generations(dependencies)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+            self.assertEqual(
+                recipe_cache.generations(dependencies), generations
+            )
+        self.assertNotEqual(
+            recipe_cache.generations(dependencies), generations
+        )
+        outcome, ids = self.anonymous_ids('/api/recipes/')
+        self.assertEqual(outcome, 'MISS')
+        self.assertNotIn(recipe.id, ids)
+
+    def test_favorite_invalidates_counter_ordering(self):
+        url = '/api/recipes/?ordering=-favorites_count'
+        first, second = self.anonymous_ids(url)[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/recipes/{second}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.anonymous_ids(url), ('MISS', [second, first]))
+
+
+class RecipeMatcherTest(TestCase):
+    """
+    Пакетное обновление индекса совпадает с полной перестройкой,
+    а устаревший индекс не задерживает запросы.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        user = create_user(0)
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+        cls.recipes = create_recipes([user], [], cls.ingredients[:2], 3)
+
+    def test_update_recipes_matches_rebuild(self):
+        matcher = RecipeMatcher()
+        matcher.build()
+        changes = {
+            self.recipes[0].id: [self.ingredients[2].id],
+            self.recipes[1].id: [
+                self.ingredients[1].id, self.ingredients[3].id
+            ],
+            self.recipes[2].id: [],
+        }
+        for recipe_id, ingredient_ids in changes.items():
+            AmountIngredient.objects.filter(recipe_id=recipe_id).delete()
+            AmountIngredient.objects.bulk_create(
+                AmountIngredient(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=5,
+                )
+                for ingredient_id in ingredient_ids
+            )
+        matcher.update_recipes(changes.items())
+        rebuilt = RecipeMatcher()
+        rebuilt.build()
+        self.assertEqual(matcher.load(), rebuilt.load())
+
+    def test_expired_index_is_served_while_rebuilding(self):
+        matcher = RecipeMatcher()
+        matcher.build()
+        snapshot = matcher.load()
+        matcher._expires_at = 0.0
+        # Блокировка занята другой перестройкой: load() не ждёт её.
+        with matcher._lock:
+            self.assertIs(matcher.load(), snapshot)
+
+
+class SerializeTimingTest(TestCase):
+    """
+    Время сериализации учитывается и для сериализаторов DRF.
+    """
+    def measure(self, serialize):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            serialize()
+        finally:
+            current_metrics.reset(token)
+        return metrics.timings['serialize']
+
+    def test_drf_serializer_is_timed(self):
+        tag = Tag.objects.create(
+            name='завтрак', color='#000001', slug='breakfast'
+        )
+        self.assertGreater(
+            self.measure(lambda: TagSerializer([tag], many=True).data), 0
+        )
+
+    def test_nested_timers_are_counted_once(self):
+        inner = []
+
+        def serialize():
+            with timer('serialize'):
+                with timer('serialize'):
+                    pass
+                inner.append(current_metrics.get().timings['serialize'])
+
+        self.assertGreater(self.measure(serialize), 0)
+        self.assertEqual(inner, [0])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SearchCursorTest(IsolatedCachesMixin, TestCase):
+    """
+    С ?cursor= результаты поиска остаются упорядочены по релевантности.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        user = create_user(0)
+        cls.by_name, cls.by_text = (
+            Recipe.objects.create(
+                name=name, author=user, text=text,
+                image='recipe_images/test.png', cooking_time=10,
+            )
+            for name, text in (
+                ('Борщ', 'Свёкла и капуста'),
+                ('Суп', 'Почти как борщ'),
+            )
+        )
+
+    def setUp(self):
+        super().setUp()
+        recipe_index.invalidate()
+
+    def test_search_with_cursor_keeps_rank_order(self):
+        for query in ('search=борщ', 'search=борщ&cursor='):
+            with self.subTest(query=query):
+                response = APIClient().get(f'/api/recipes/?{query}')
+                self.assertEqual(
+                    [recipe['id'] for recipe in response.json()['results']],
+                    [self.by_name.id, self.by_text.id],
+                )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ETagTest(IsolatedCachesMixin, TestCase):
+    """
+    If-None-Match сравнивается с ETag по тегам целиком.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='завтрак', color='#000001', slug='breakfast')
+
+    def test_if_none_match(self):
+        client = APIClient()
+        etag = client.get('/api/tags/')['ETag']
+        cases = (
+            (etag, 304),
+            (f'W/{etag}', 304),
+            (f'"other", {etag}', 304),
+            ('*', 304),
+            (etag.strip('"'), 200),
+            (f'"x{etag[1:]}', 200),
+            (f'"{etag}"', 200),
+        )
+        for header, status_code in cases:
+            with self.subTest(header=header):
+                response = client.get(
+                    '/api/tags/', HTTP_IF_NONE_MATCH=header
+                )
+                self.assertEqual(response.status_code, status_code)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResponseCacheLockTest(IsolatedCachesMixin, TestCase):
+    """
+    Блокировка пересчёта снимается, даже если ответ не получен.
+    """
+    def test_lock_released_when_render_fails(self):
+        cache = ResponseCache('test')
+        cache.get_or_render('key', ('section',), lambda: b'old')
+        renders = {'none': lambda: None, 'error': lambda: 1 / 0}
+        for name, render in renders.items():
+            cache.bump('section')
+            with self.subTest(render=name):
+                try:
+                    cache.get_or_render('key', ('section',), render)
+                except ZeroDivisionError:
+                    pass
+                _, body, outcome = cache.get_or_render(
+                    'key', ('section',), lambda: b'new'
+                )
+                self.assertEqual((body, outcome), (b'new', 'miss'))
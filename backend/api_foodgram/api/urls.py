@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.views import (IngredientViewSet, MetricsView, RecipeViewSet,
+                       TagViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -14,6 +15,7 @@ router.register('users', UserViewSet, 'users')
 
 urlpatterns = (
     path('', include(router.urls)),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 )
@@ -1,34 +1,67 @@
-from datetime import datetime as dt
+from functools import partial
+from operator import itemgetter
 
-from django.conf import settings
-from django.db.models import F, Sum
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from django.http.response import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import (AllowAny, DjangoModelPermissions,
-                                        IsAuthenticated)
+                                        IsAdminUser, IsAuthenticated)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from api.pagination import CustomPagination
+from api.fast_serializers import (FastIngredientSerializer,
+                                  FastRecipeSerializer)
+from api.mixins import AnonymousCacheMixin, ReferenceCacheMixin
+from api.pagination import CustomPagination, KeysetPagination
 from api.permissions import AdminOrReadOnly, AuthorStaffOrReadOnly
-from api.serializers import (IngredientSerializer, OptimizedRecipeSerializer,
-                             RecipeSerializer, SubscriptionSerializer,
-                             TagSerializer, UserWithSubscriptionSerializer)
-from core.enums import Tuples
-from core.filters import RecipeFilter, IngredientFilter
-from recipes.models import (AmountIngredient, Favorite,
-                            Ingredient, Recipe, ShoppingCart, Tag)
+from api.renderers import CsvRenderer, PdfRenderer, TxtRenderer
+from api.serializers import (BulkIdsSerializer, IngredientSerializer,
+                             OptimizedRecipeSerializer, RecipeSerializer,
+                             SubscriptionSerializer, TagSerializer,
+                             UserWithSubscriptionSerializer)
+from core.enums import Tuples, UrlQueries
+from core.autocomplete import ingredient_index
+from core.cache import recipe_cache
+from core.catalog import CatalogImport, export_recipes
+from core.counters import change_counter
+from core.filters import RecipeFilter, tag_ids_by_slug
+from core.matching import recipe_matcher
+from core.metrics import metrics_registry
+from core.services import (cart_totals_add, cart_totals_add_many,
+                           cart_totals_remove, delete_existing,
+                           delete_existing_many, insert_ignore,
+                           insert_ignore_many)
+from core.shopping_list import SHOPPING_LIST_FORMATS
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from users.models import Subscriptions, User
 
 
 class UserViewSet(DjoserUserViewSet):
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
+    keyset_ordering = ('username', 'id')
     permission_classes = (DjangoModelPermissions,)
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get(
+            UrlQueries.RECIPES_LIMIT
+        )
+        if recipes_limit is None or not recipes_limit.isdigit():
+            return None
+        return int(recipes_limit) or None
+
+    def get_subscription_context(self):
+        context = self.get_serializer_context()
+        context['recipes_limit'] = self.get_recipes_limit()
+        return context
+
     @action(
         methods=('post', 'delete'),
         detail=True,
@@ -37,19 +70,105 @@ class UserViewSet(DjoserUserViewSet):
     def subscribe(self, request, id):
         author = get_object_or_404(User, id=id)
         user = request.user
-        subscription = Subscriptions.objects.filter(user=user, author=author)
+        authors = User.objects.filter(pk=author.pk)
 
-        if request.method == 'POST' and not subscription:
-            Subscriptions.objects.create(user=user, author=author)
-            serializer = SubscriptionSerializer(author)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if request.method == 'POST' and user != author:
+            with transaction.atomic():
+                created = insert_ignore(
+                    Subscriptions, user=user, author=author
+                )
+                if created:
+                    change_counter(authors, 'subscribers_count', 1)
+            if created:
+                author.refresh_from_db(fields=('subscribers_count',))
+                serializer = SubscriptionSerializer(
+                    author, context=self.get_subscription_context()
+                )
+                return Response(
+                    serializer.data, status=status.HTTP_201_CREATED
+                )
 
-        if request.method == 'DELETE' and subscription:
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method == 'DELETE':
+            with transaction.atomic():
+                deleted = delete_existing(
+                    Subscriptions, user=user, author=author
+                )
+                if deleted:
+                    change_counter(authors, 'subscribers_count', -1)
+            if deleted:
+                return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    def with_limited_recipes(self, authors):
+        recipes_limit = self.get_recipes_limit()
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'cooking_time', 'author'
+        )
+        if recipes_limit:
+            # Срез в Prefetch выполняется оконной функцией:
+            # одним запросом для всех авторов страницы.
+            recipes = recipes[:recipes_limit]
+        return authors.prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
+    @action(
+        methods=('post', 'delete'),
+        detail=False,
+        url_path='subscribe',
+        permission_classes=(IsAuthenticated,)
+    )
+    def subscribe_bulk(self, request):
+        """
+        Подписка на нескольких авторов или отписка от них
+        одним запросом: {"ids": [1, 2, 3]}.
+        """
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+
+        found = set(User.objects.filter(id__in=ids).values_list(
+            'id', flat=True
+        ))
+        missing = [pk for pk in ids if pk not in found]
+        if missing or user.id in found:
+            return Response(
+                {'ids': missing or [user.id]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if request.method == 'POST':
+            with transaction.atomic():
+                changed = insert_ignore_many(
+                    Subscriptions,
+                    [Subscriptions(user=user, author_id=pk) for pk in ids],
+                    returning='author',
+                )
+                change_counter(
+                    User.objects.filter(pk__in=changed),
+                    'subscribers_count', 1,
+                )
+            serializer = SubscriptionSerializer(
+                self.with_limited_recipes(
+                    User.objects.filter(pk__in=changed)
+                ).order_by('username'),
+                many=True,
+                context=self.get_subscription_context(),
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        with transaction.atomic():
+            changed = delete_existing_many(
+                Subscriptions.objects.filter(user=user, author_id__in=ids),
+                'author_id',
+            )
+            change_counter(
+                User.objects.filter(pk__in=changed), 'subscribers_count', -1
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(
         methods=('get',),
         detail=False
@@ -59,9 +178,13 @@ class UserViewSet(DjoserUserViewSet):
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
         pages = self.paginate_queryset(
-            User.objects.filter(subscribers__user=request.user)
+            self.with_limited_recipes(User.objects.filter(
+                subscribers__user=request.user
+            )).order_by('username')
+        )
+        serializer = SubscriptionSerializer(
+            pages, many=True, context=self.get_subscription_context()
         )
-        serializer = SubscriptionSerializer(pages, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -85,27 +208,244 @@ class UserViewSet(DjoserUserViewSet):
             )
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
+    cache_section = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AdminOrReadOnly,)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
+    cache_section = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AdminOrReadOnly,)
-    filter_backends = [DjangoFilterBackend]
-    filterset_class = IngredientFilter
 
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return FastIngredientSerializer
+        return super().get_serializer_class()
+
+    def filter_queryset(self, queryset):
+        name = self.request.query_params.get(UrlQueries.SEARCH_ING_NAME)
+        if self.action != 'list' or name is None:
+            return super().filter_queryset(queryset)
+        return ingredient_index.search(name)
 
-class RecipeViewSet(ModelViewSet):
+
+class RecipeViewSet(AnonymousCacheMixin, ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (AuthorStaffOrReadOnly,)
-    pagination_class = CustomPagination
-    filter_backends = [DjangoFilterBackend]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'carts_count')
+    # Действия, которые отдают рецепты в формате RecipeSerializer
+    # только для чтения, - их выводит FastRecipeSerializer.
+    fast_actions = ('list', 'retrieve', 'trending', 'cookable')
+
+    @property
+    def keyset_ordering(self):
+        # Курсор строится по выбранной сортировке, id - разрыв равенства.
+        ordering = OrderingFilter().get_ordering(
+            self.request, self.queryset, self
+        )
+        if not ordering:
+            if self.request.query_params.get(UrlQueries.SEARCH, '').strip():
+                # Поиск сортирует по релевантности, ключа для курсора
+                # нет - страницы выдаются по номеру.
+                return None
+            ordering = ('-pub_date',)
+        return (*ordering, '-id')
+
+    def get_serializer_class(self):
+        if self.action in self.fast_actions and self.request.method == 'GET':
+            return FastRecipeSerializer
+        return super().get_serializer_class()
+
+    def cache_dependencies(self, request):
+        """
+        Разделы кэша, от которых зависит ответ анонимному пользователю:
+        сам рецепт, рецепты автора, рецепты с тэгами или все рецепты,
+        а при сортировке по счётчику - ещё и этот счётчик.
+        """
+        if self.action == 'retrieve':
+            return ('reference', f'recipe:{self.kwargs["pk"]}')
+        counters = tuple(
+            f'counter:{field.lstrip("-")}'
+            for field in self.keyset_ordering or ()
+            if field.lstrip('-') in Recipe.counter_fields
+        )
+        author = request.query_params.get('author', '')
+        if author.isdigit():
+            return ('reference', f'author:{author}', *counters)
+        ids_by_slug = tag_ids_by_slug()
+        tags = request.query_params.getlist('tags')
+        if tags and all(slug in ids_by_slug for slug in tags):
+            return (
+                'reference',
+                *(f'tag:{ids_by_slug[slug]}' for slug in sorted(set(tags))),
+                *counters,
+            )
+        return ('reference', 'recipes', *counters)
+
+    def perform_create(self, serializer):
+        serializer.save()
+        # Ответ строится по рецепту со связями, загруженными разом.
+        serializer.instance = self.get_read_queryset().get(
+            pk=serializer.instance.pk
+        )
+
+    def perform_update(self, serializer):
+        self.perform_create(serializer)
+
+    def get_queryset(self):
+        # Для изменения и удаления связи и аннотации не нужны.
+        if self.action in ('update', 'partial_update', 'destroy'):
+            return Recipe.objects.all()
+        return self.get_read_queryset()
+
+    def get_read_queryset(self):
+        queryset = Recipe.objects.select_related(
+            'author'
+        ).prefetch_related(
+            'tags', 'ingredients__ingredient'
+        )
+        user = self.request.user
+
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                recipe=OuterRef('pk'), user=user
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                recipe=OuterRef('pk'), user=user
+            )),
+        )
+
+    def toggle_relation(self, request, pk, model, counter,
+                        on_add=None, on_remove=None):
+        """
+        Добавляет (GET, POST) или удаляет (DELETE) связь пользователя
+        с рецептом. Наличие связи проверяет сама база: ON CONFLICT
+        при вставке и число удалённых строк при удалении, поэтому
+        параллельные запросы получают 201/204 ровно один раз, а
+        остальные - 400.
+        """
+        recipe = get_object_or_404(
+            Recipe.objects.only('id', 'name', 'image', 'cooking_time'),
+            id=pk,
+        )
+        recipes = Recipe.objects.filter(pk=recipe.pk)
+
+        if request.method in Tuples.ADD_METHODS:
+            with transaction.atomic():
+                changed = insert_ignore(
+                    model, user=request.user, recipe=recipe
+                )
+                if changed:
+                    change_counter(recipes, counter, 1)
+                    recipe_cache.bump_on_commit(f'counter:{counter}')
+                    if on_add:
+                        on_add(request.user, recipe)
+            if changed:
+                serializer = OptimizedRecipeSerializer(recipe)
+                return Response(
+                    serializer.data, status=status.HTTP_201_CREATED
+                )
+        else:
+            with transaction.atomic():
+                changed = delete_existing(
+                    model, user=request.user, recipe=recipe
+                )
+                if changed:
+                    change_counter(recipes, counter, -1)
+                    recipe_cache.bump_on_commit(f'counter:{counter}')
+                    if on_remove:
+                        on_remove(request.user, recipe)
+            if changed:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    def bulk_relation(self, request, model, counter,
+                      on_add=None, on_remove=None):
+        """
+        Пакетный вариант toggle_relation: добавляет (POST) или удаляет
+        (DELETE) связи с рецептами из {"ids": [...]} за постоянное
+        число запросов независимо от их количества.
+        """
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'cooking_time'
+        ).in_bulk(ids)
+        missing = [pk for pk in ids if pk not in recipes]
+        if missing:
+            return Response(
+                {'ids': missing}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if request.method == 'POST':
+            with transaction.atomic():
+                changed = insert_ignore_many(
+                    model,
+                    [model(user=request.user, recipe_id=pk) for pk in ids],
+                    returning='recipe',
+                )
+                change_counter(
+                    Recipe.objects.filter(pk__in=changed), counter, 1
+                )
+                if changed:
+                    recipe_cache.bump_on_commit(f'counter:{counter}')
+                if changed and on_add:
+                    on_add(request.user, changed)
+            serializer = OptimizedRecipeSerializer(
+                [recipes[pk] for pk in changed], many=True
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        with transaction.atomic():
+            changed = delete_existing_many(
+                model.objects.filter(user=request.user, recipe_id__in=ids),
+                'recipe_id',
+            )
+            change_counter(Recipe.objects.filter(pk__in=changed), counter, -1)
+            if changed:
+                recipe_cache.bump_on_commit(f'counter:{counter}')
+            if changed and on_remove:
+                on_remove(request.user, changed)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        methods=('post', 'delete'),
+        detail=False,
+        url_path='favorite',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_bulk(self, request):
+        return self.bulk_relation(request, Favorite, 'favorites_count')
+
+    @action(
+        methods=('post', 'delete'),
+        detail=False,
+        url_path='shopping_cart',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_relation(
+            request, ShoppingCart, 'carts_count',
+            on_add=cart_totals_add_many,
+            on_remove=partial(cart_totals_add_many, sign=-1),
+        )
 
     @action(
         methods=Tuples.ACTION_METHODS,
@@ -113,16 +453,7 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def favorite(self, request, pk):
-        recipe = get_object_or_404(self.queryset, id=pk)
-        favorite = recipe.in_favorites.filter(user=request.user).first()
-
-        if not favorite:
-            Favorite.objects.create(user=request.user, recipe=recipe)
-            serializer = OptimizedRecipeSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.toggle_relation(request, pk, Favorite, 'favorites_count')
 
     @action(
         methods=Tuples.ACTION_METHODS,
@@ -130,58 +461,142 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(self.queryset, id=pk)
-        shopping_cart = recipe.in_carts.filter(user=request.user).first()
+        return self.toggle_relation(
+            request, pk, ShoppingCart, 'carts_count',
+            on_add=cart_totals_add, on_remove=cart_totals_remove,
+        )
 
-        if not shopping_cart:
-            ShoppingCart.objects.create(user=request.user, recipe=recipe)
-            serializer = OptimizedRecipeSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            shopping_cart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+    @action(
+        methods=('get', 'post'),
+        detail=False,
+        permission_classes=(IsAdminUser,),
+        parser_classes=(),
+    )
+    def catalog(self, request):
+        """
+        Выгрузка (GET) и загрузка (POST) каталога рецептов в NDJSON
+        потоком, без чтения всего тела запроса в память.
+        """
+        if request.method == 'GET':
+            return StreamingHttpResponse(
+                export_recipes(), content_type='application/x-ndjson'
+            )
+        catalog = CatalogImport().run(request.stream or ())
+        return Response(
+            {
+                'created': catalog.created,
+                'errors': [
+                    {'line': number, 'error': error}
+                    for number, error in sorted(
+                        catalog.errors, key=itemgetter(0)
+                    )
+                ],
+            },
+            status=(
+                status.HTTP_201_CREATED if catalog.created
+                else status.HTTP_400_BAD_REQUEST
+            ),
+        )
 
     @action(
         methods=('get',),
-        detail=False
+        detail=False,
+    )
+    def trending(self, request):
+        """
+        Популярные рецепты по рейтингу, который заранее считает
+        команда update_trending.
+        """
+        queryset = self.get_queryset().filter(
+            trending__isnull=False
+        ).order_by('-trending__score', '-id')
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(queryset, request, self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        methods=('get',),
+        detail=False,
+    )
+    def cookable(self, request):
+        """
+        Рецепты, которые можно приготовить из переданных ингредиентов,
+        по убыванию доли имеющихся ингредиентов.
+        """
+        ingredient_ids = [
+            int(ing_id)
+            for ing_id in request.query_params.getlist(UrlQueries.INGREDIENTS)
+            if ing_id.isdigit()
+        ]
+        try:
+            min_coverage = float(
+                request.query_params.get(UrlQueries.MIN_COVERAGE, 0)
+            )
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(
+            recipe_matcher.match(ingredient_ids, min_coverage), request, self
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page]
+        )
+        page = [
+            (recipes[recipe_id], coverage)
+            for recipe_id, coverage in page
+            if recipe_id in recipes
+        ]
+        data = self.get_serializer(
+            [recipe for recipe, _ in page], many=True
+        ).data
+        for item, (_, coverage) in zip(data, page):
+            item['coverage'] = round(coverage, 3)
+        return paginator.get_paginated_response(data)
+
+    @action(
+        methods=('get',),
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(JSONRenderer, TxtRenderer, CsvRenderer, PdfRenderer),
     )
     def download_shopping_cart(self, request):
         user = self.request.user
         if not Recipe.objects.filter(in_carts__user=user).exists():
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        filename, shopping_list = self.generate_shopping_list(user)
-        response = self.create_downloadable_response(filename, shopping_list)
-        return response
-
-    def generate_shopping_list(self, user):
-        filename = f'{user.username}_shopping_list.txt'
-        shopping_list = [
-            f'Список покупок для:\n\n{user.first_name}\n'
-            f'{dt.now().strftime(settings.DATE_TIME_FORMAT)}\n'
-        ]
+        export_format = request.accepted_renderer.format
+        if export_format not in SHOPPING_LIST_FORMATS:
+            export_format = 'txt'
+        content_type, stream = SHOPPING_LIST_FORMATS[export_format]
 
-        ingredients = AmountIngredient.objects.filter(
-            recipe__in_carts__user=user
-        ).values(
-            'ingredient__name',
-            measurement=F('ingredient__measurement_unit')
-        ).annotate(amount=Sum('amount'))
-
-        for ing in ingredients:
-            shopping_list.append(
-                f'{ing["ingredient__name"]}: '
-                f'{ing["amount"]} {ing["measurement"]}'
-            )
+        response = StreamingHttpResponse(
+            stream(user), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename={user.username}_shopping_list.'
+            f'{export_format}'
+        )
+        return response
 
-        shopping_list.append('\nПосчитано в Foodgram')
-        shopping_list = '\n'.join(shopping_list)
 
-        return filename, shopping_list
+class MetricsView(APIView):
+    """
+    Счётчики RequestMetricsMiddleware и кэша ответов
+    в текстовом формате Prometheus.
+    """
+    permission_classes = (IsAdminUser,)
 
-    def create_downloadable_response(self, filename, shopping_list):
-        response = HttpResponse(
-            shopping_list, content_type='text.txt; charset=utf-8'
+    def get(self, request):
+        lines = [
+            '# HELP foodgram_response_cache_total Обращения к кэшу ответов',
+            '# TYPE foodgram_response_cache_total counter',
+        ] + [
+            f'foodgram_response_cache_total{{outcome="{outcome}"}} {count}'
+            for outcome, count in recipe_cache.stats().items()
+        ]
+        return HttpResponse(
+            metrics_registry.export() + '\n'.join(lines) + '\n',
+            content_type='text/plain; version=0.0.4; charset=utf-8',
         )
-        response['Content-Disposition'] = f'attachment; filename={filename}'
-        return response
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'api.apps.ApiConfig',
     'users.apps.UsersConfig',
@@ -50,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'api_foodgram.urls'
@@ -88,6 +90,22 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': config(
+            'SHARED_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': config(
+            'SHARED_CACHE_LOCATION',
+            default=os.path.join(BASE_DIR, 'cache'),
+        ),
+    },
+}
+
 AUTH_USER_MODEL = 'users.User'
 
 # Password validation
@@ -118,6 +136,11 @@ REST_FRAMEWORK = {
 
     'DEFAULT_PERMISSION_CLASSES':
     ['rest_framework.permissions.IsAuthenticatedOrReadOnly', ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 DJOSER = {
@@ -130,6 +153,7 @@ DJOSER = {
         'user_list': ('api.permissions.OwnerUserOrReadOnly',),
     },
     'SERIALIZERS': {
+        'user': 'api.serializers.UserWithSubscriptionSerializer',
         'user_list': 'api.serializers.UserWithSubscriptionSerializer',
         'current_user': 'api.serializers.UserWithSubscriptionSerializer',
     },
@@ -156,6 +180,49 @@ EMAIL_ADMIN = 'admin@example.com'
 DATE_TIME_FORMAT = '%d/%m/%Y %H:%M'
 
 PAGE_NUMBER = 6
+MAX_PAGE_SIZE = 100
+MAX_BULK_SIZE = 100
+CATALOG_CHUNK_SIZE = 500
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+REFERENCE_VERSION_TTL = 2
+RESPONSE_CACHE_TTL = 60
+RESPONSE_CACHE_STALE_TTL = 300
+RESPONSE_CACHE_LOCK_TTL = 30
+
+RECIPE_MATCHER_TTL = 600
+
+REQUEST_METRICS_ENABLED = config(
+    'REQUEST_METRICS_ENABLED', default=False, cast=bool
+)
+REQUEST_METRICS_SAMPLE_RATE = config(
+    'REQUEST_METRICS_SAMPLE_RATE', default=1.0, cast=float
+)
+
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_WINDOW_DAYS = 30
+TRENDING_TOP_K = 500
+TRENDING_FAVORITE_WEIGHT = 1.0
+TRENDING_CART_WEIGHT = 1.5
+
+SEARCH_CONFIG = 'russian'
+SEARCH_MAX_RESULTS = 1000
+
+MAX_IMAGE_UPLOAD_SIZE = 5 * 1024 * 1024
+MAX_IMAGE_PIXELS = 4096 * 4096
+BASE64_CHUNK_SIZE = 64 * 1024
+
+IMAGE_WORKERS = config('IMAGE_WORKERS', default=2, cast=int)
+IMAGE_WEBP_QUALITY = 80
+
+SHOPPING_LIST_CHUNK_SIZE = 500
+SHOPPING_LIST_PDF_CHUNK_SIZE = 64 * 1024
+SHOPPING_LIST_PDF_SPOOL_SIZE = 1024 * 1024
+SHOPPING_LIST_PDF_MAX_ROWS = 2000
+SHOPPING_LIST_FONT = config(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
 
 MAX_LEN_EMAIL_FIELD = 256
 MAX_LEN_USERS_CHARFIELD = 32
@@ -0,0 +1,62 @@
+from bisect import bisect_left
+from threading import Lock
+
+from core.cache import reference_cache
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """
+    Отсортированный индекс названий ингредиентов в памяти процесса.
+
+    Сначала отдаются совпадения по началу названия (бинарный поиск
+    по отсортированному списку), затем вхождения в середине названия.
+    Индекс строится лениво и помечается версией раздела ingredients
+    из reference_cache. Версию увеличивает любой процесс после коммита
+    изменения ингредиентов, поэтому все воркеры перестраивают индекс
+    при первом запросе с новой версией, а ответы для новой версии
+    не строятся по старому индексу.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._index = None
+
+    def load(self):
+        # Версия читается до данных: индекс не старее своей версии.
+        version = reference_cache.version('ingredients')
+        index = self._index
+        if index is None or index[2] != version:
+            with self._lock:
+                index = self._index
+                if index is None or index[2] != version:
+                    rows = sorted(
+                        ((ing.name.lower(), ing.pk), ing)
+                        for ing in Ingredient.objects.all().iterator()
+                    )
+                    index = self._index = (
+                        [name for (name, _), _ in rows],
+                        [ing for _, ing in rows],
+                        version,
+                    )
+        return index[0], index[1]
+
+    def search(self, query: str) -> list[Ingredient]:
+        """
+        Возвращает ингредиенты в порядке релевантности.
+        """
+        query = query.strip().lower()
+        names, ingredients = self.load()
+        if not query:
+            return ingredients
+
+        start = end = bisect_left(names, query)
+        while end < len(names) and names[end].startswith(query):
+            end += 1
+
+        return ingredients[start:end] + [
+            ing for name, ing in zip(names, ingredients)
+            if query in name and not name.startswith(query)
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,221 @@
+from collections import Counter
+from hashlib import md5
+from threading import Lock
+from time import time, time_ns
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class VersionedCache:
+    """
+    Двухуровневый кэш готовых ответов для справочных данных.
+
+    Версия каждого раздела хранится в общем кэше и увеличивается
+    сигналами после коммита изменений. Тела ответов лежат в памяти
+    процесса (default) и в общем кэше (shared) под ключом с версией,
+    поэтому после смены версии старые записи просто перестают читаться.
+
+    Версия запоминается в памяти процесса на REFERENCE_VERSION_TTL
+    секунд, чтобы ответ из памяти не требовал обращения к общему кэшу:
+    другие процессы видят новую версию с этой задержкой.
+    """
+    def __init__(self, local_alias='default', shared_alias='shared'):
+        self.local_alias = local_alias
+        self.shared_alias = shared_alias
+
+    @property
+    def local(self):
+        return caches[self.local_alias]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def version(self, section: str) -> int:
+        key = f'{section}:version'
+        version = self.local.get(key)
+        if version is None:
+            version = self.shared.get(key)
+            if version is None:
+                # Начальная версия от времени: если ключ версии пропал
+                # из общего кэша, старые записи не станут снова свежими.
+                self.shared.add(key, time_ns(), timeout=None)
+                version = self.shared.get(key)
+            self.local.set(key, version, settings.REFERENCE_VERSION_TTL)
+        return version
+
+    def bump(self, section: str) -> None:
+        key = f'{section}:version'
+        try:
+            version = self.shared.incr(key)
+        except ValueError:
+            version = time_ns()
+            self.shared.set(key, version, timeout=None)
+        self.local.set(key, version, settings.REFERENCE_VERSION_TTL)
+
+    def bump_on_commit(self, section: str) -> None:
+        transaction.on_commit(lambda: self.bump(section))
+
+    def get(self, section: str, key: str):
+        """
+        Возвращает (etag, body) или None.
+        """
+        versioned_key = self.versioned_key(section, key)
+        entry = self.local.get(versioned_key)
+        if entry is None:
+            entry = self.shared.get(versioned_key)
+            if entry is not None:
+                self.local.set(
+                    versioned_key, entry, settings.REFERENCE_CACHE_TIMEOUT
+                )
+        return entry
+
+    def set(self, section: str, key: str, body: bytes):
+        versioned_key = self.versioned_key(section, key)
+        entry = (f'"{md5(body).hexdigest()}"', body)
+        self.local.set(versioned_key, entry, settings.REFERENCE_CACHE_TIMEOUT)
+        self.shared.set(
+            versioned_key, entry, settings.REFERENCE_CACHE_TIMEOUT
+        )
+        return entry
+
+    def get_or_compute(self, section: str, key: str, compute):
+        """
+        Значение, вычисленное из справочных данных, в памяти процесса.
+        """
+        versioned_key = self.versioned_key(section, key)
+        value = self.local.get(versioned_key)
+        if value is None:
+            value = compute()
+            self.local.set(
+                versioned_key, value, settings.REFERENCE_CACHE_TIMEOUT
+            )
+        return value
+
+    def versioned_key(self, section: str, key: str) -> str:
+        key = md5(key.encode()).hexdigest()
+        return f'{section}:{self.version(section)}:{key}'
+
+
+reference_cache = VersionedCache()
+
+
+class ResponseCache:
+    """
+    Кэш готовых ответов с точной инвалидацией по счётчикам поколений.
+
+    Запись хранит поколения разделов (рецепт, автор, тэг, ...), от
+    которых зависит ответ. Сигналы увеличивают поколения изменённых
+    разделов, и запись с устаревшими поколениями или старше ttl
+    считается несвежей. Несвежая запись ещё stale_ttl секунд отдаётся
+    всем, кроме одного запроса, который пересчитывает ответ
+    (stale-while-revalidate).
+
+    Попадания и промахи считаются в памяти процесса и отдаются
+    через /api/metrics/: запись счётчика в общий кэш на каждый
+    запрос стоила бы обращения к диску.
+    """
+    outcomes = ('hit', 'miss', 'stale')
+
+    def __init__(self, prefix, alias='shared'):
+        self.prefix = prefix
+        self.alias = alias
+        self._stats = Counter()
+        self._stats_lock = Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def generation_key(self, dependency: str) -> str:
+        return f'{self.prefix}:gen:{dependency}'
+
+    def generations(self, dependencies) -> tuple:
+        keys = [self.generation_key(name) for name in dependencies]
+        found = self.cache.get_many(keys)
+        return tuple(found.get(key, 0) for key in keys)
+
+    def bump(self, *dependencies) -> None:
+        for dependency in dependencies:
+            key = self.generation_key(dependency)
+            self.cache.add(key, 0, timeout=None)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, 1, timeout=None)
+
+    def bump_on_commit(self, *dependencies) -> None:
+        """
+        Увеличивает поколения после коммита: иначе параллельный запрос
+        успел бы сохранить под новыми поколениями ещё старые данные.
+        """
+        transaction.on_commit(lambda: self.bump(*dependencies))
+
+    def get_or_render(self, key: str, dependencies, render):
+        """
+        Возвращает (etag, body, outcome). render() вызывается при
+        промахе и должен вернуть тело ответа или None, если ответ
+        кэшировать нельзя.
+        """
+        key = f'{self.prefix}:{md5(key.encode()).hexdigest()}'
+        generations = self.generations(dependencies)
+        entry = self.cache.get(key)
+        now = time()
+
+        locked = False
+        if entry is not None:
+            etag, body, entry_generations, fresh_until = entry
+            if entry_generations == generations and now < fresh_until:
+                return self.record(etag, body, 'hit')
+            locked = self.cache.add(
+                f'{key}:lock', 1, timeout=settings.RESPONSE_CACHE_LOCK_TTL
+            )
+            if not locked:
+                return self.record(etag, body, 'stale')
+
+        try:
+            body = render()
+            if body is None:
+                return None, None, 'miss'
+            etag = f'"{md5(body).hexdigest()}"'
+            self.cache.set(
+                key,
+                (etag, body, generations, now + settings.RESPONSE_CACHE_TTL),
+                settings.RESPONSE_CACHE_TTL
+                + settings.RESPONSE_CACHE_STALE_TTL,
+            )
+        finally:
+            # Блокировка снимается и при ошибке рендеринга, иначе
+            # до её истечения все получали бы несвежий ответ.
+            if locked:
+                self.cache.delete(f'{key}:lock')
+        return self.record(etag, body, 'miss')
+
+    def record(self, etag, body, outcome):
+        with self._stats_lock:
+            self._stats[outcome] += 1
+        return etag, body, outcome
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {outcome: self._stats[outcome] for outcome in self.outcomes}
+
+    def recipe_dependencies(self, recipe, tag_ids=None) -> tuple:
+        if tag_ids is None:
+            tag_ids = recipe.tags.values_list('id', flat=True)
+        return (
+            'recipes',
+            f'recipe:{recipe.pk}',
+            f'author:{recipe.author_id}',
+            *(f'tag:{tag_id}' for tag_id in tag_ids),
+        )
+
+    def invalidate_recipe(self, recipe, tag_ids=None) -> None:
+        # Разделы собираются сразу: при удалении рецепта его тэги
+        # после коммита уже не прочитать.
+        self.bump_on_commit(*self.recipe_dependencies(recipe, tag_ids))
+
+
+recipe_cache = ResponseCache('recipes')
@@ -0,0 +1,245 @@
+import json
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+from core.cache import recipe_cache
+from core.counters import change_counter
+from core.filters import tag_ids_by_slug
+from core.matching import recipe_matcher
+from core.search import recipe_index, update_search_vector
+from recipes.models import AmountIngredient, Ingredient, Recipe
+from users.models import User
+
+
+class IngredientLineSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    measurement_unit = serializers.CharField()
+    amount = serializers.IntegerField(
+        min_value=settings.MIN_AMOUNT_INGREDIENTS,
+        max_value=32767,
+    )
+
+
+class RecipeLineSerializer(serializers.Serializer):
+    """
+    Одна строка NDJSON-каталога. Автор задаётся email, тэги - слагами,
+    ингредиенты - названием и единицей измерения, изображение - путём
+    к уже загруженному в хранилище файлу.
+    """
+    name = serializers.CharField(
+        max_length=settings.MAX_LEN_RECIPES_CHARFIELD,
+    )
+    text = serializers.CharField(
+        max_length=settings.MAX_LEN_RECIPES_TEXTFIELD,
+    )
+    cooking_time = serializers.IntegerField(
+        min_value=settings.MIN_COOKING_TIME,
+        max_value=settings.MAX_COOKING_TIME,
+    )
+    author = serializers.EmailField()
+    image = serializers.CharField()
+    tags = serializers.ListField(
+        child=serializers.SlugField(), allow_empty=False,
+    )
+    ingredients = IngredientLineSerializer(many=True, allow_empty=False)
+
+
+def export_recipes(chunk_size=None):
+    """
+    Строки NDJSON со всеми рецептами. Рецепты читаются порциями
+    по chunk_size вместе с тэгами и ингредиентами, поэтому память
+    не растёт с размером каталога.
+    """
+    recipes = Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredients',
+            queryset=AmountIngredient.objects.select_related('ingredient'),
+        ),
+    ).order_by('id')
+    for recipe in recipes.iterator(
+        chunk_size=chunk_size or settings.CATALOG_CHUNK_SIZE
+    ):
+        yield json.dumps(
+            {
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'author': recipe.author.email if recipe.author else None,
+                'image': recipe.image.name,
+                'tags': [tag.slug for tag in recipe.tags.all()],
+                'ingredients': [
+                    {
+                        'name': amount.ingredient.name,
+                        'measurement_unit': amount.ingredient.measurement_unit,
+                        'amount': amount.amount,
+                    }
+                    for amount in recipe.ingredients.all()
+                ],
+            },
+            ensure_ascii=False,
+        ) + '\n'
+
+
+def parse_lines(lines):
+    """
+    (номер строки, данные или None, ошибка) для каждой непустой строки.
+    """
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except ValueError as error:
+            yield number, None, f'Неверный JSON: {error}'
+
+
+class CatalogImport:
+    """
+    Загрузка рецептов из NDJSON пакетами по batch_size строк.
+
+    На каждый пакет - один запрос за авторами, один за ингредиентами,
+    один за уже существующими рецептами и по одному bulk_create для
+    рецептов, ингредиентов и тэгов. Строки с ошибками пропускаются
+    и попадают в errors. Изображения не обрабатываются повторно.
+    """
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.CATALOG_CHUNK_SIZE
+        self.created = 0
+        self.errors = []
+
+    def run(self, lines):
+        rows = parse_lines(lines)
+        while batch := list(islice(rows, self.batch_size)):
+            self.import_batch(batch)
+        recipe_index.invalidate()
+        return self
+
+    def validate(self, batch):
+        valid = []
+        for number, data, error in batch:
+            if error:
+                self.errors.append((number, error))
+                continue
+            serializer = RecipeLineSerializer(data=data)
+            if serializer.is_valid():
+                valid.append((number, serializer.validated_data))
+            else:
+                self.errors.append((number, serializer.errors))
+        return valid
+
+    def import_batch(self, batch):
+        rows = self.validate(batch)
+        if not rows:
+            return
+
+        authors = dict(User.objects.filter(
+            email__in={data['author'] for _, data in rows}
+        ).values_list('email', 'id'))
+        tags = tag_ids_by_slug()
+        ingredients = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={
+                    item['name']
+                    for _, data in rows
+                    for item in data['ingredients']
+                }
+            ).values_list('id', 'name', 'measurement_unit')
+        }
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={data['name'] for _, data in rows},
+        ).values_list('name', 'author_id'))
+
+        recipes, amounts, recipe_tags = [], [], []
+        for number, data in rows:
+            author_id = authors.get(data['author'])
+            key = (data['name'], author_id)
+            error = None
+            if author_id is None:
+                error = f'Автор {data["author"]} не найден'
+            elif key in existing:
+                error = 'Рецепт с таким названием у автора уже есть'
+            elif unknown := [s for s in data['tags'] if s not in tags]:
+                error = f'Несуществующие тэги: {", ".join(unknown)}'
+            elif unknown := [
+                item['name'] for item in data['ingredients']
+                if (item['name'], item['measurement_unit'])
+                not in ingredients
+            ]:
+                error = f'Несуществующие ингредиенты: {", ".join(unknown)}'
+            if error:
+                self.errors.append((number, error))
+                continue
+            existing.add(key)
+
+            recipe = Recipe(
+                name=data['name'],
+                text=data['text'],
+                cooking_time=data['cooking_time'],
+                author_id=author_id,
+                image=data['image'],
+            )
+            recipes.append(recipe)
+            recipe_amounts = Counter()
+            for item in data['ingredients']:
+                recipe_amounts[
+                    ingredients[item['name'], item['measurement_unit']]
+                ] += item['amount']
+            amounts.append(recipe_amounts)
+            recipe_tags.append({tags[slug] for slug in data['tags']})
+
+        if recipes:
+            self.write(recipes, amounts, recipe_tags)
+
+    @transaction.atomic
+    def write(self, recipes, amounts, recipe_tags):
+        Recipe.objects.bulk_create(recipes)
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for recipe, recipe_amounts in zip(recipes, amounts)
+            for ingredient_id, amount in recipe_amounts.items()
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag_id=tag_id)
+            for recipe, tag_ids in zip(recipes, recipe_tags)
+            for tag_id in tag_ids
+        )
+        # bulk_create не вызывает сигналы, поэтому счётчики авторов,
+        # поисковый вектор и индекс ингредиентов обновляются здесь.
+        for author_id, count in Counter(
+            recipe.author_id for recipe in recipes
+        ).items():
+            change_counter(
+                User.objects.filter(pk=author_id), 'recipes_count', count
+            )
+        update_search_vector(
+            Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes])
+        )
+        matches = [
+            (recipe.pk, list(recipe_amounts))
+            for recipe, recipe_amounts in zip(recipes, amounts)
+        ]
+
+        dependencies = {'recipes'} | {
+            f'author:{recipe.author_id}' for recipe in recipes
+        } | {
+            f'tag:{tag_id}' for tag_ids in recipe_tags for tag_id in tag_ids
+        }
+
+        def update_indexes():
+            recipe_matcher.update_recipes(matches)
+            recipe_cache.bump(*dependencies)
+
+        transaction.on_commit(update_indexes)
+        self.created += len(recipes)
@@ -0,0 +1,59 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+class CounterFieldsMixin:
+    """
+    Модель с денормализованными счётчиками.
+
+    Счётчики меняются только через change_counter(), поэтому обычный
+    save() существующей записи их не перезаписывает - иначе значение,
+    прочитанное до параллельного инкремента, затёрло бы его.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get('update_fields') is None
+            and self.counter_fields
+        ):
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+def change_counter(queryset, field: str, delta: int) -> None:
+    """
+    Атомарно меняет счётчик одним UPDATE без чтения значения.
+    """
+    if delta:
+        queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def count_of(model, field):
+    """
+    Подзапрос с количеством строк model, ссылающихся на внешнюю запись.
+    """
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def recount(queryset, field: str, related, lookup: str) -> int:
+    """
+    Пересчитывает счётчик field записей queryset по строкам related.
+    """
+    return queryset.update(**{field: count_of(related, lookup)})
@@ -3,6 +3,8 @@ from enum import Enum, IntEnum
 
 class Tuples(tuple, Enum):
     RECIPE_IMAGE_SIZE = 500, 300
+    RECIPE_THUMBNAIL_SIZE = 150, 90
+    RECIPE_FULL_SIZE = 1000, 600
     SYMBOL_TRUE_SEARCH = '1', 'true'
     SYMBOL_FALSE_SEARCH = '0', 'false'
     ADD_METHODS = 'GET', 'POST'
@@ -34,3 +36,7 @@ class UrlQueries(str, Enum):
     SHOP_CART = 'is_in_shopping_cart'
     AUTHOR = 'author'
     TAGS = 'tags'
+    RECIPES_LIMIT = 'recipes_limit'
+    SEARCH = 'search'
+    INGREDIENTS = 'ingredients'
+    MIN_COVERAGE = 'min_coverage'
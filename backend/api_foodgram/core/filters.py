@@ -1,24 +1,38 @@
+from django import forms
 from django.contrib.auth import get_user_model
-from django_filters.rest_framework import CharFilter, FilterSet, filters
+from django.db.models import Exists, OuterRef
+from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Recipe, Tag, Ingredient
+from core.cache import reference_cache
+from core.search import search_recipes
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
 
 User = get_user_model()
 
 
-class IngredientFilter(FilterSet):
-    name = CharFilter(field_name='name', lookup_expr='icontains')
+def tag_ids_by_slug() -> dict:
+    return reference_cache.get_or_compute(
+        'tags', 'ids-by-slug',
+        lambda: dict(Tag.objects.values_list('slug', 'id')),
+    )
 
-    class Meta:
-        model = Ingredient
-        fields = ['name']
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_ids_by_slug()]
+
+
+class TagSlugsFilter(filters.Filter):
+    """
+    Несколько слагов тэгов; проверяются по кэшированному словарю
+    slug -> id без запроса к базе.
+    """
+    field_class = forms.MultipleChoiceField
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
+    tags = TagSlugsFilter(
+        choices=tag_choices,
+        method='get_tags',
     )
     author = filters.ModelChoiceFilter(
         queryset=User.objects.all(),
@@ -29,15 +43,25 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart',
     )
+    search = filters.CharFilter(
+        method='get_search',
+    )
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'author', 'tags', 'is_in_shopping_cart']
+        fields = [
+            'is_favorited', 'author', 'tags', 'is_in_shopping_cart', 'search'
+        ]
 
     def get_tags(self, queryset, name, value):
         if value:
-            queryset = queryset.filter(
-                tags__slug__in=value).distinct()
+            ids_by_slug = tag_ids_by_slug()
+            queryset = queryset.filter(Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'),
+                    tag_id__in=[ids_by_slug[slug] for slug in value],
+                )
+            ))
         return queryset
 
     def get_author(self, queryset, name, value):
@@ -49,22 +73,21 @@ class RecipeFilter(FilterSet):
         if self.request.user.is_anonymous:
             return queryset
 
-        if value:
-            queryset = queryset.filter(in_carts__user=self.request.user)
-
-        else:
-            queryset = queryset.exclude(in_carts__user=self.request.user)
-
-        return queryset
+        in_cart = Exists(ShoppingCart.objects.filter(
+            recipe=OuterRef('pk'), user=self.request.user
+        ))
+        return queryset.filter(in_cart if value else ~in_cart)
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_anonymous:
             return queryset
 
-        if value:
-            queryset = queryset.filter(in_favorites__user=self.request.user)
-
-        else:
-            queryset = queryset.exclude(in_favorites__user=self.request.user)
+        favorited = Exists(Favorite.objects.filter(
+            recipe=OuterRef('pk'), user=self.request.user
+        ))
+        return queryset.filter(favorited if value else ~favorited)
 
+    def get_search(self, queryset, name, value):
+        if value.strip():
+            queryset = search_recipes(queryset, value)
         return queryset
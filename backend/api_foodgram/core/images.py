@@ -0,0 +1,86 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from core.enums import Tuples
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix='recipe-images',
+)
+
+IMAGE_VARIANTS = {
+    'thumbnail': Tuples.RECIPE_THUMBNAIL_SIZE,
+    'card': Tuples.RECIPE_IMAGE_SIZE,
+    'full': Tuples.RECIPE_FULL_SIZE,
+}
+
+
+def variant_path(path, variant: str, extension: str | None = None) -> Path:
+    path = Path(path)
+    return path.with_name(
+        f'{path.stem}_{variant}{extension or path.suffix}'
+    )
+
+
+def variant_paths(path) -> list[Path]:
+    return [
+        variant_path(path, variant, extension)
+        for variant in IMAGE_VARIANTS
+        for extension in (None, '.webp')
+    ]
+
+
+def save_atomic(image, path: Path, **params) -> None:
+    """
+    Пишет во временный файл и подменяет целевой, чтобы параллельные
+    запросы не получили недописанное изображение.
+    """
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    image.save(tmp_path, format=params.pop('format', image.format), **params)
+    os.replace(tmp_path, path)
+
+
+def process_recipe_image(path) -> None:
+    """
+    Строит уменьшенные копии изображения рецепта (в исходном формате
+    и в WebP) и заменяет оригинал карточкой прежнего размера.
+    """
+    path = Path(path)
+    with Image.open(path) as original:
+        original.load()
+    image_format = original.format
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'A' in original.mode else 'RGB')
+
+    variants = {}
+    for variant, size in IMAGE_VARIANTS.items():
+        resized = variants[variant] = ImageOps.fit(
+            original, size, Image.LANCZOS
+        )
+        save_atomic(
+            resized, variant_path(path, variant), format=image_format
+        )
+        save_atomic(
+            resized, variant_path(path, variant, '.webp'),
+            format='WEBP', quality=settings.IMAGE_WEBP_QUALITY,
+        )
+
+    save_atomic(variants['card'], path, format=image_format)
+
+
+def run_safely(path) -> None:
+    try:
+        process_recipe_image(path)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', path)
+
+
+def schedule_image_processing(path) -> None:
+    executor.submit(run_safely, path)
@@ -0,0 +1,136 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from threading import Lock, Thread
+from time import monotonic
+
+from django.conf import settings
+from django.db import connections
+
+from recipes.models import AmountIngredient
+
+
+class RecipeMatcher:
+    """
+    Инвертированный индекс «ингредиент -> рецепты» для поиска рецептов,
+    которые можно приготовить из имеющихся продуктов.
+
+    Списки рецептов хранятся отсортированными массивами array('I').
+    Индекс обновляется точечно при сохранении состава рецепта в этом
+    процессе и полностью перестраивается раз в RECIPE_MATCHER_TTL,
+    чтобы подхватить изменения из других воркеров и админки.
+
+    Индекс не меняется на месте: обновление собирает новые словари
+    и массивы и подменяет снимок (postings, recipes) одним
+    присваиванием, поэтому match() без блокировки всегда видит
+    согласованное состояние. Устаревший индекс перестраивается
+    в фоновом потоке, а запросы до замены получают прежний снимок.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._snapshot = None
+        self._expires_at = 0.0
+
+    def load(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Отдать пока нечего - ждём первую сборку.
+            with self._lock:
+                if self._snapshot is None:
+                    self.build()
+                return self._snapshot
+        if monotonic() > self._expires_at and self._lock.acquire(
+            blocking=False
+        ):
+            Thread(target=self.refresh, daemon=True).start()
+        return snapshot
+
+    def refresh(self) -> None:
+        """
+        Перестраивает индекс в фоне и освобождает блокировку,
+        взятую в load().
+        """
+        try:
+            self.build()
+        finally:
+            self._lock.release()
+            connections.close_all()
+
+    def build(self) -> None:
+        postings, recipes = {}, {}
+        rows = AmountIngredient.objects.values_list(
+            'ingredient_id', 'recipe_id'
+        ).order_by('ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in rows.iterator(chunk_size=10000):
+            postings.setdefault(ingredient_id, array('I')).append(recipe_id)
+            recipes.setdefault(recipe_id, array('I')).append(ingredient_id)
+        self._snapshot = postings, recipes
+        self._expires_at = monotonic() + settings.RECIPE_MATCHER_TTL
+
+    def update_recipe(self, recipe_id: int, ingredient_ids) -> None:
+        self.update_recipes(((recipe_id, ingredient_ids),))
+
+    def update_recipes(self, items) -> None:
+        """
+        Применяет пары (recipe_id, ingredient_ids) к одной копии
+        снимка: пакет стоит одного копирования словарей.
+        """
+        if self._snapshot is None:
+            return
+        with self._lock:
+            postings, recipes = (dict(part) for part in self._snapshot)
+            copied = set()
+            for recipe_id, ingredient_ids in items:
+                old_ids = set(recipes.pop(recipe_id, ()))
+                new_ids = set(ingredient_ids)
+                if new_ids:
+                    recipes[recipe_id] = array('I', sorted(new_ids))
+                for ingredient_id in old_ids ^ new_ids:
+                    posting = postings.get(ingredient_id, array('I'))
+                    if ingredient_id not in copied:
+                        # Массив из старого снимка копируется один раз.
+                        posting = array('I', posting)
+                        copied.add(ingredient_id)
+                    position = bisect_left(posting, recipe_id)
+                    present = (
+                        position < len(posting)
+                        and posting[position] == recipe_id
+                    )
+                    if ingredient_id in new_ids and not present:
+                        posting.insert(position, recipe_id)
+                    elif ingredient_id not in new_ids and present:
+                        posting.pop(position)
+                    if posting:
+                        postings[ingredient_id] = posting
+                    else:
+                        postings.pop(ingredient_id, None)
+            self._snapshot = postings, recipes
+
+    def remove_recipe(self, recipe_id: int) -> None:
+        self.update_recipe(recipe_id, ())
+
+    def match(self, ingredient_ids, min_coverage: float = 0.0):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов, в виде
+        [(recipe_id, coverage)], где coverage - доля ингредиентов
+        рецепта, которые есть у пользователя.
+        """
+        # Один снимок на весь расчёт: обновления его не меняют.
+        postings, recipes = self.load()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+
+        ranked = []
+        for recipe_id, count in matched.items():
+            required = recipes.get(recipe_id)
+            if not required:
+                continue
+            coverage = count / len(required)
+            if coverage >= min_coverage:
+                ranked.append((coverage, count, recipe_id))
+        ranked.sort(reverse=True)
+        return [(recipe_id, coverage) for coverage, _, recipe_id in ranked]
+
+
+recipe_matcher = RecipeMatcher()
@@ -0,0 +1,107 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Измерения одного запроса: число и время SQL-запросов (через
+    connection.execute_wrapper) и время отдельных этапов обработки.
+    """
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = defaultdict(float)
+        self.active = set()
+        self.duration = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += perf_counter() - started
+
+    def stop(self) -> None:
+        self.duration = perf_counter() - self.started
+
+
+@contextmanager
+def timer(name: str):
+    """
+    Добавляет время блока к этапу name текущего запроса.
+    Вложенные блоки того же этапа не учитываются повторно.
+    Если замеры для запроса выключены, ничего не делает.
+    """
+    metrics = current_metrics.get()
+    if metrics is None or name in metrics.active:
+        yield
+        return
+    metrics.active.add(name)
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += perf_counter() - started
+        metrics.active.discard(name)
+
+
+class MetricsRegistry:
+    """
+    Накопительные счётчики по эндпоинтам в памяти процесса
+    для выгрузки в формате Prometheus.
+    """
+    fields = (
+        ('requests_total', 'Обработано запросов'),
+        ('db_queries_total', 'SQL-запросов'),
+        ('db_seconds_total', 'Время SQL-запросов, с'),
+        ('serialize_seconds_total', 'Время сериализации, с'),
+        ('render_seconds_total', 'Время рендеринга ответа, с'),
+        ('duration_seconds_total', 'Время обработки запроса, с'),
+        ('response_bytes_total', 'Размер ответов, байт'),
+    )
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counters = defaultdict(lambda: defaultdict(float))
+
+    def record(self, labels: tuple, metrics, size: int) -> None:
+        values = {
+            'requests_total': 1,
+            'db_queries_total': metrics.queries,
+            'db_seconds_total': metrics.db_time,
+            'serialize_seconds_total': metrics.timings['serialize'],
+            'render_seconds_total': metrics.timings['render'],
+            'duration_seconds_total': metrics.duration,
+            'response_bytes_total': size,
+        }
+        with self._lock:
+            counters = self._counters[labels]
+            for name, value in values.items():
+                counters[name] += value
+
+    def export(self, prefix='foodgram') -> str:
+        with self._lock:
+            snapshot = {
+                labels: dict(counters)
+                for labels, counters in self._counters.items()
+            }
+        lines = []
+        for name, description in self.fields:
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} counter')
+            for (method, view, status), counters in sorted(snapshot.items()):
+                lines.append(
+                    f'{prefix}_{name}{{method="{method}",view="{view}",'
+                    f'status="{status}"}} {counters[name]:.15g}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,131 @@
+import re
+from collections import defaultdict
+from math import log
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import Case, F, IntegerField, When
+
+from recipes.models import Recipe
+
+WORD = re.compile(r'\w+')
+RUSSIAN_ENDINGS = sorted(
+    (
+        'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+        'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+        'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ов', 'ев', 'ую', 'юю',
+        'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+    ),
+    key=len,
+    reverse=True,
+)
+
+
+def recipe_search_vector():
+    return (
+        SearchVector('name', weight='A', config=settings.SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=settings.SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(queryset) -> None:
+    if connection.vendor == 'postgresql':
+        queryset.update(search_vector=recipe_search_vector())
+
+
+def stem(word: str) -> str:
+    """
+    Упрощённый стеммер для резервного индекса: отбрасывает
+    типичное окончание, если остаётся основа из трёх букв и больше.
+    """
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    return [stem(word) for word in WORD.findall(text.lower())]
+
+
+class InvertedIndex:
+    """
+    Резервный полнотекстовый индекс в памяти процесса для баз без
+    полнотекстового поиска (SQLite в разработке и тестах).
+    """
+    name_weight = 2.0
+
+    def __init__(self):
+        self._lock = Lock()
+        self._index = None
+
+    def invalidate(self) -> None:
+        self._index = None
+
+    def load(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                index = self._index
+                if index is None:
+                    index = self._index = self.build()
+        return index
+
+    def build(self):
+        postings = defaultdict(lambda: defaultdict(float))
+        recipes_count = 0
+        recipes = Recipe.objects.values_list('id', 'name', 'text')
+        for recipe_id, name, text in recipes.iterator():
+            recipes_count += 1
+            for token in tokenize(name):
+                postings[token][recipe_id] += self.name_weight
+            for token in tokenize(text):
+                postings[token][recipe_id] += 1
+        return postings, recipes_count
+
+    def search(self, query: str) -> list[int]:
+        """
+        id рецептов, содержащих все слова запроса, по убыванию
+        суммарного веса слов (tf * idf).
+        """
+        postings, recipes_count = self.load()
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        matches = [postings.get(token, {}) for token in tokens]
+        ids = set.intersection(*(set(match) for match in matches))
+        scores = {
+            recipe_id: sum(
+                match[recipe_id] * log(1 + recipes_count / len(match))
+                for match in matches
+            )
+            for recipe_id in ids
+        }
+        return sorted(scores, key=lambda pk: (-scores[pk], -pk))
+
+
+recipe_index = InvertedIndex()
+
+
+def search_recipes(queryset, query: str):
+    """
+    Отбирает рецепты по запросу и сортирует их по релевантности.
+    """
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(
+            search_vector=search_query
+        ).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-pub_date', '-id')
+
+    ids = recipe_index.search(query)[:settings.SEARCH_MAX_RESULTS]
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *(When(pk=pk, then=position) for position, pk in enumerate(ids)),
+        output_field=IntegerField(),
+    ))
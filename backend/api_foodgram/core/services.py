@@ -1,16 +1,265 @@
-from django.shortcuts import get_object_or_404
+from collections import defaultdict
 
-from recipes.models import AmountIngredient, Ingredient
+from django.db import connection, transaction
+from django.db.models import Sum
 
+from core.cache import recipe_cache
+from core.matching import recipe_matcher
+from recipes.models import AmountIngredient, CartIngredient, ShoppingCart
 
-def recipe_ingredients_set(recipe, ingredients) -> None:
-    recipe_ingredients = list()
-    for ing_id, ing_amount in ingredients.items():
-        recipe_ingredients.append(
-            AmountIngredient(
-                ingredient=get_object_or_404(Ingredient, id=ing_id),
-                recipe=recipe,
-                amount=ing_amount[1],
-            )
+
+def recipe_ingredients_set(recipe, ingredients, created=False) -> None:
+    """
+    Сохраняет состав рецепта {ingredient_id: (Ingredient, amount)}.
+
+    Ингредиенты уже загружены при валидации, поэтому запросов
+    постоянное число: чтение текущих строк, затем удаление, создание
+    и изменение только отличающихся строк. Изменение состава
+    переносится в списки покупок.
+    """
+    rows = {} if created else {
+        row.ingredient_id: row
+        for row in AmountIngredient.objects.filter(recipe=recipe)
+    }
+    old_amounts = {
+        ingredient_id: row.amount for ingredient_id, row in rows.items()
+    }
+    to_create, to_update = [], []
+    for ingredient, amount in ingredients.values():
+        row = rows.pop(ingredient.id, None)
+        if row is None:
+            to_create.append(AmountIngredient(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            ))
+        elif row.amount != amount:
+            row.amount = amount
+            to_update.append(row)
+
+    if rows:
+        AmountIngredient.objects.filter(
+            pk__in=[row.pk for row in rows.values()]
+        ).delete()
+    AmountIngredient.objects.bulk_create(to_create)
+    AmountIngredient.objects.bulk_update(to_update, ('amount',))
+    recipe_ingredients_changed(
+        recipe,
+        old_amounts,
+        {ingredient.id: amount for ingredient, amount in ingredients.values()},
+        created,
+    )
+
+
+def recipe_ingredients_changed(recipe, old_amounts, new_amounts,
+                               created=False) -> None:
+    """
+    Переносит изменение состава рецепта в списки покупок,
+    индекс подбора рецептов и кэш ответов.
+    """
+    if not created:
+        cart_totals_recipe_changed(recipe, old_amounts, new_amounts)
+
+    def ingredients_changed():
+        recipe_matcher.update_recipe(recipe.id, new_amounts.keys())
+        recipe_cache.invalidate_recipe(recipe)
+
+    transaction.on_commit(ingredients_changed)
+
+
+def recipe_amounts(recipe) -> dict:
+    """
+    Количество ингредиентов рецепта в виде {ingredient_id: amount}.
+    """
+    return dict(
+        AmountIngredient.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount')
+    )
+
+
+@transaction.atomic
+def change_cart_totals(deltas) -> None:
+    """
+    Применяет изменения {(user_id, ingredient_id): delta}
+    к итогам списков покупок.
+
+    Прибавления пишутся одним INSERT ... ON CONFLICT DO UPDATE,
+    поэтому два параллельных первых добавления одного ингредиента
+    не упираются в уникальность. Вычитаемые строки уже существуют:
+    они блокируются, уменьшаются и удаляются, если итог дошёл до нуля.
+    """
+    increments = {
+        key: delta for key, delta in deltas.items() if delta > 0
+    }
+    decrements = {
+        key: delta for key, delta in deltas.items() if delta < 0
+    }
+    if increments:
+        add_cart_totals(increments)
+    if not decrements:
+        return
+
+    rows = CartIngredient.objects.select_for_update().filter(
+        user_id__in={user_id for user_id, _ in decrements},
+        ingredient_id__in={ingredient_id for _, ingredient_id in decrements},
+    )
+    to_update, to_delete = [], []
+    for row in rows:
+        delta = decrements.get((row.user_id, row.ingredient_id))
+        if delta is None:
+            continue
+        row.amount += delta
+        if row.amount > 0:
+            to_update.append(row)
+        else:
+            to_delete.append(row.pk)
+    CartIngredient.objects.bulk_update(to_update, ('amount',))
+    CartIngredient.objects.filter(pk__in=to_delete).delete()
+
+
+def add_cart_totals(increments) -> None:
+    """
+    Прибавляет {(user_id, ingredient_id): amount} к итогам одним
+    INSERT ... ON CONFLICT (user_id, ingredient_id) DO UPDATE.
+    """
+    opts = CartIngredient._meta
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    user, ingredient, amount = (
+        quote(opts.get_field(name).column)
+        for name in ('user', 'ingredient', 'amount')
+    )
+    sql = (
+        f'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+        f'VALUES {", ".join(["(%s, %s, %s)"] * len(increments))} '
+        f'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+        f'SET {amount} = {table}.{amount} + EXCLUDED.{amount}'
+    )
+    params = [
+        value
+        for (user_id, ingredient_id), delta in sorted(increments.items())
+        for value in (user_id, ingredient_id, delta)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def cart_totals_add(user, recipe, sign=1) -> None:
+    change_cart_totals({
+        (user.id, ingredient_id): sign * amount
+        for ingredient_id, amount in recipe_amounts(recipe).items()
+    })
+
+
+def cart_totals_remove(user, recipe) -> None:
+    cart_totals_add(user, recipe, sign=-1)
+
+
+def cart_totals_add_many(user, recipe_ids, sign=1) -> None:
+    amounts = AmountIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values('ingredient_id').annotate(
+        total=Sum('amount')
+    ).order_by().values_list('ingredient_id', 'total')
+    change_cart_totals({
+        (user.id, ingredient_id): sign * total
+        for ingredient_id, total in amounts
+    })
+
+
+def cart_totals_recipe_changed(recipe, old_amounts, new_amounts) -> None:
+    """
+    Переносит изменение состава рецепта в списки покупок всех
+    пользователей, у которых этот рецепт в корзине.
+    """
+    changes = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
         )
-    AmountIngredient.objects.bulk_create(recipe_ingredients)
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+
+    deltas = defaultdict(int)
+    user_ids = ShoppingCart.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', flat=True)
+    for user_id in user_ids:
+        for ingredient_id, delta in changes.items():
+            deltas[user_id, ingredient_id] += delta
+    if deltas:
+        change_cart_totals(deltas)
+
+
+def insert_ignore_many(model, instances, returning: str = 'pk') -> list:
+    """
+    Вставляет строки одним INSERT ... ON CONFLICT DO NOTHING
+    и возвращает значения поля returning только для добавленных строк:
+    уже существующие пропускаются без IntegrityError.
+    """
+    if not instances:
+        return []
+    opts = model._meta
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    returning = opts.pk if returning == 'pk' else opts.get_field(returning)
+    quote = connection.ops.quote_name
+    row = f'({", ".join(["%s"] * len(fields))})'
+    sql = (
+        f'INSERT INTO {quote(opts.db_table)} '
+        f'({", ".join(quote(field.column) for field in fields)}) '
+        f'VALUES {", ".join([row] * len(instances))} '
+        f'ON CONFLICT DO NOTHING '
+        f'RETURNING {quote(returning.column)}'
+    )
+    params = [
+        field.get_db_prep_save(field.pre_save(instance, True), connection)
+        for instance in instances
+        for field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [value for value, in cursor.fetchall()]
+
+
+def insert_ignore(model, **values) -> bool:
+    """
+    INSERT ... ON CONFLICT DO NOTHING одним запросом.
+    Возвращает True, если строка добавлена, и False, если такая
+    уже есть - без исключения IntegrityError при гонке запросов.
+    """
+    return bool(insert_ignore_many(model, [model(**values)]))
+
+
+def delete_existing(model, **lookups) -> bool:
+    """
+    Удаляет строку одним DELETE и возвращает True, если она была.
+    """
+    deleted, _ = model.objects.filter(**lookups).delete()
+    return bool(deleted)
+
+
+def delete_existing_many(queryset, field: str) -> list:
+    """
+    Удаляет строки queryset и возвращает значения field удалённых.
+    Строки блокируются до удаления, поэтому параллельный запрос
+    не посчитает их удалёнными второй раз.
+    """
+    removed = list(
+        queryset.select_for_update().values_list(field, flat=True)
+    )
+    if removed:
+        queryset.filter(**{f'{field}__in': removed}).delete()
+    return removed
+
+
+def subscribed_author_ids(user, author_ids) -> set:
+    """
+    Авторы из author_ids, на которых подписан user, одним запросом.
+    """
+    if user.is_anonymous or not author_ids:
+        return set()
+    return set(user.subscriptions.filter(
+        author_id__in=author_ids
+    ).values_list('author_id', flat=True))
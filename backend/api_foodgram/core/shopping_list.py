@@ -0,0 +1,148 @@
+import csv
+from datetime import datetime as dt
+from itertools import islice
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db.models import F
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+from recipes.models import CartIngredient
+
+
+class Echo:
+    """
+    Псевдо-буфер для csv.writer: возвращает записанную строку,
+    не накапливая её в памяти.
+    """
+    def write(self, value):
+        return value
+
+
+def shopping_list_ingredients(user):
+    """
+    Суммарное количество ингредиентов из списка покупок пользователя.
+
+    Итоги уже посчитаны в CartIngredient, а строки читаются курсором
+    на стороне сервера порциями, поэтому память не растёт
+    с количеством рецептов в корзине.
+    """
+    return CartIngredient.objects.filter(
+        user=user
+    ).values(
+        'ingredient__name',
+        'amount',
+        measurement=F('ingredient__measurement_unit'),
+    ).order_by(
+        'ingredient__name', 'measurement'
+    ).iterator(
+        chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE
+    )
+
+
+def shopping_list_header(user):
+    return (
+        f'Список покупок для:\n\n{user.first_name}\n'
+        f'{dt.now().strftime(settings.DATE_TIME_FORMAT)}\n'
+    )
+
+
+def txt_stream(user):
+    yield shopping_list_header(user) + '\n'
+    for ing in shopping_list_ingredients(user):
+        yield (
+            f'{ing["ingredient__name"]}: '
+            f'{ing["amount"]} {ing["measurement"]}\n'
+        )
+    yield '\nПосчитано в Foodgram'
+
+
+def csv_stream(user):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единицы измерения'))
+    for ing in shopping_list_ingredients(user):
+        yield writer.writerow((
+            ing['ingredient__name'], ing['amount'], ing['measurement']
+        ))
+
+
+def pdf_stream(user):
+    """
+    PDF собирается построчно из того же курсора; таблица ссылок PDF
+    пишется в конце документа, поэтому готовый файл отдаётся порциями.
+
+    reportlab держит страницы документа в памяти до сохранения,
+    поэтому память здесь не постоянна: число строк ограничено
+    SHOPPING_LIST_PDF_MAX_ROWS, а готовый файл больше
+    SHOPPING_LIST_PDF_SPOOL_SIZE пишется во временный файл на диске.
+    Полный список без ограничений отдают TXT и CSV.
+    """
+    font = pdf_font()
+    buffer = SpooledTemporaryFile(
+        max_size=settings.SHOPPING_LIST_PDF_SPOOL_SIZE
+    )
+    canvas = Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+    y = height - margin
+
+    def draw_line(text, size=12):
+        nonlocal y
+        if y < margin:
+            canvas.showPage()
+            y = height - margin
+        canvas.setFont(font, size)
+        canvas.drawString(margin, y, text)
+        y -= line_height
+
+    for line in shopping_list_header(user).splitlines():
+        draw_line(line, size=14)
+    max_rows = settings.SHOPPING_LIST_PDF_MAX_ROWS
+    rows = 0
+    for ing in islice(shopping_list_ingredients(user), max_rows + 1):
+        rows += 1
+        if rows > max_rows:
+            draw_line('')
+            draw_line(
+                f'Показаны первые {max_rows} позиций, полный список '
+                f'доступен в форматах TXT и CSV.',
+                size=10,
+            )
+            break
+        draw_line(
+            f'• {ing["ingredient__name"]}: '
+            f'{ing["amount"]} {ing["measurement"]}'
+        )
+    draw_line('')
+    draw_line('Посчитано в Foodgram', size=10)
+    canvas.save()
+
+    with buffer:
+        buffer.seek(0)
+        while chunk := buffer.read(settings.SHOPPING_LIST_PDF_CHUNK_SIZE):
+            yield chunk
+
+
+def pdf_font():
+    """
+    Регистрирует шрифт с кириллицей, если он есть в системе.
+    """
+    font_name = 'ShoppingListFont'
+    if font_name in pdfmetrics.getRegisteredFontNames():
+        return font_name
+    font_path = Path(settings.SHOPPING_LIST_FONT)
+    if not font_path.exists():
+        return 'Helvetica'
+    pdfmetrics.registerFont(TTFont(font_name, str(font_path)))
+    return font_name
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', txt_stream),
+    'csv': ('text/csv; charset=utf-8', csv_stream),
+    'pdf': ('application/pdf', pdf_stream),
+}
@@ -1,13 +1,133 @@
 from pathlib import Path
 
-from django.db.models.signals import post_delete
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 from django.dispatch import receiver
 
-from recipes.models import Recipe
+from core.cache import recipe_cache, reference_cache
+from core.counters import change_counter, recount
+from core.images import variant_paths
+from core.matching import recipe_matcher
+from core.search import recipe_index, update_search_vector
+from core.services import cart_totals_recipe_changed, recipe_amounts
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Subscriptions, User
 
 
 @receiver(post_delete, sender=Recipe)
 def delete_image(sender, instance, *a, **kw):
     image = Path(instance.image.path)
-    if image.exists():
-        image.unlink()
+    for path in (image, *variant_paths(image)):
+        path.unlink(missing_ok=True)
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, *a, **kw):
+    if created and instance.author_id:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, *a, **kw):
+    if instance.author_id:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+        )
+
+
+@receiver(pre_delete, sender=User)
+def remember_counter_targets(sender, instance, *a, **kw):
+    # Избранное, корзина и подписки пользователя удаляются каскадом
+    # без сигналов, поэтому затронутые счётчики пересчитываются
+    # после удаления.
+    instance._counter_targets = (
+        (Recipe, 'favorites_count', Favorite, 'recipe', list(
+            Favorite.objects.filter(user=instance).values_list(
+                'recipe_id', flat=True
+            )
+        )),
+        (Recipe, 'carts_count', ShoppingCart, 'recipe', list(
+            ShoppingCart.objects.filter(user=instance).values_list(
+                'recipe_id', flat=True
+            )
+        )),
+        (User, 'subscribers_count', Subscriptions, 'author', list(
+            Subscriptions.objects.filter(user=instance).values_list(
+                'author_id', flat=True
+            )
+        )),
+    )
+
+
+@receiver(post_delete, sender=User)
+def recount_counter_targets(sender, instance, *a, **kw):
+    for model, field, related, lookup, ids in getattr(
+        instance, '_counter_targets', ()
+    ):
+        if ids:
+            recount(
+                model.objects.filter(pk__in=ids), field, related, lookup
+            )
+            if model is Recipe:
+                recipe_cache.bump_on_commit(f'counter:{field}')
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_cart_totals(sender, instance, *a, **kw):
+    cart_totals_recipe_changed(instance, recipe_amounts(instance), {})
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, *a, **kw):
+    reference_cache.bump_on_commit('ingredients')
+    recipe_cache.bump_on_commit('reference')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, *a, **kw):
+    reference_cache.bump_on_commit('tags')
+    recipe_cache.bump_on_commit('reference')
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, update_fields, *a, **kw):
+    if update_fields is not None and not {'name', 'text'} & update_fields:
+        return
+    if not instance.search_source_changed():
+        return
+    update_search_vector(Recipe.objects.filter(pk=instance.pk))
+    instance.remember_search_source()
+    recipe_index.invalidate()
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_search(sender, instance, *a, **kw):
+    recipe_index.invalidate()
+    recipe_matcher.remove_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(pre_delete, sender=Recipe)
+def invalidate_recipe_cache(sender, instance, *a, **kw):
+    recipe_cache.invalidate_recipe(instance)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_cache(sender, instance, action, pk_set, **kw):
+    if action == 'pre_clear':
+        recipe_cache.invalidate_recipe(instance)
+    elif action in ('post_add', 'post_remove'):
+        recipe_cache.invalidate_recipe(instance, pk_set)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_cache(sender, instance, update_fields, *a, **kw):
+    # Вход в систему обновляет только last_login - на ответы не влияет.
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    if instance.recipes_count:
+        recipe_cache.bump_on_commit('reference')
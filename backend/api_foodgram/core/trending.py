@@ -0,0 +1,48 @@
+from collections import defaultdict
+from datetime import timedelta
+from heapq import nlargest
+from math import exp, log
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import Favorite, ShoppingCart, TrendingScore
+
+
+def trending_scores(now=None) -> dict:
+    """
+    Рейтинг рецептов {recipe_id: score}: каждое добавление в избранное
+    или список покупок даёт вес, который уменьшается вдвое каждые
+    TRENDING_HALF_LIFE_HOURS. События старше TRENDING_WINDOW_DAYS
+    не учитываются.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    decay = log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+    scores = defaultdict(float)
+    for model, weight in (
+        (Favorite, settings.TRENDING_FAVORITE_WEIGHT),
+        (ShoppingCart, settings.TRENDING_CART_WEIGHT),
+    ):
+        events = model.objects.filter(
+            date_added__gte=since
+        ).values_list('recipe_id', 'date_added')
+        for recipe_id, date_added in events.iterator(chunk_size=10000):
+            age = (now - date_added).total_seconds()
+            scores[recipe_id] += weight * exp(-decay * age)
+    return scores
+
+
+@transaction.atomic
+def update_trending(now=None) -> int:
+    scores = trending_scores(now)
+    top = nlargest(
+        settings.TRENDING_TOP_K, scores.items(), key=lambda item: item[1]
+    )
+    TrendingScore.objects.all().delete()
+    TrendingScore.objects.bulk_create(
+        TrendingScore(recipe_id=recipe_id, score=score)
+        for recipe_id, score in top
+    )
+    return len(top)
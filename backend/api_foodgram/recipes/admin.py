@@ -3,6 +3,11 @@ from django.contrib.admin import (ModelAdmin, TabularInline, display, register,
 from django.core.handlers.wsgi import WSGIRequest
 from django.utils.html import format_html
 from django.utils.safestring import SafeString, mark_safe
+
+from core.cache import recipe_cache
+from core.counters import change_counter
+from core.services import (cart_totals_add, recipe_amounts,
+                           recipe_ingredients_changed)
 from recipes.forms import TagForm, RecipeForm, AmountIngredientInlineFormSet
 from recipes.models import (AmountIngredient, ShoppingCart, Favorite,
                             Ingredient, Recipe, Tag)
@@ -57,13 +62,25 @@ class RecipeAdmin(ModelAdmin):
     save_on_top = True
     empty_value_display = EMPTY_VALUE_DISPLAY
 
+    def save_related(self, request, form, formsets, change):
+        # Состав из инлайна переносится в списки покупок так же,
+        # как при изменении рецепта через API.
+        old_amounts = recipe_amounts(form.instance) if change else {}
+        super().save_related(request, form, formsets, change)
+        recipe_ingredients_changed(
+            form.instance,
+            old_amounts,
+            recipe_amounts(form.instance),
+            created=not change,
+        )
+
     def get_image(self, obj: Recipe) -> SafeString:
         return mark_safe(f'<img src={obj.image.url} width="80" hieght="30"')
 
     get_image.short_description = 'Изображение'
 
     def count_favorites(self, obj: Recipe) -> int:
-        return obj.in_favorites.count()
+        return obj.favorites_count
 
     count_favorites.short_description = 'В избранном'
 
@@ -100,6 +117,13 @@ class FavoriteAdmin(ModelAdmin):
         'user__username', 'recipe__name'
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        change_counter(
+            Recipe.objects.filter(pk=obj.recipe_id), 'favorites_count', 1
+        )
+        recipe_cache.bump_on_commit('counter:favorites_count')
+
     def has_change_permission(
         self,
         request: WSGIRequest,
@@ -124,6 +148,14 @@ class CardAdmin(ModelAdmin):
         'user__username', 'recipe__name'
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        cart_totals_add(obj.user, obj.recipe)
+        change_counter(
+            Recipe.objects.filter(pk=obj.recipe_id), 'carts_count', 1
+        )
+        recipe_cache.bump_on_commit('counter:carts_count')
+
     def has_change_permission(
         self,
         request: WSGIRequest,
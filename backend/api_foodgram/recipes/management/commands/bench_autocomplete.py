@@ -0,0 +1,75 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.autocomplete import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку поиска ингредиентов при одновременном '
+        'наборе запросов несколькими пользователями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--words', type=int, default=500)
+        parser.add_argument(
+            '--orm',
+            action='store_true',
+            help='Сравнить с поиском name__icontains через ORM.',
+        )
+
+    def typing_queries(self, words):
+        """
+        Каждое слово «набирается» по букве: в, ва, вар, ...
+        """
+        return [
+            word[:length]
+            for word in words
+            for length in range(1, min(len(word), 8) + 1)
+        ]
+
+    def measure(self, search, queries, threads):
+        def timed(query):
+            started = perf_counter()
+            search(query)
+            return perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(timed, queries))
+
+    def report(self, title, timings):
+        p50, p95, p99 = (
+            quantiles(timings, n=100)[i] * 1000 for i in (49, 94, 98)
+        )
+        self.stdout.write(
+            f'{title}: {len(timings)} запросов, '
+            f'p50={p50:.3f} мс, p95={p95:.3f} мс, p99={p99:.3f} мс'
+        )
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('Нет ингредиентов, загрузите фикстуры.')
+        queries = self.typing_queries(
+            random.choices(names, k=options['words'])
+        )
+
+        ingredient_index.load()
+        self.report('Индекс', self.measure(
+            ingredient_index.search, queries, options['threads']
+        ))
+
+        if options['orm']:
+            self.report('ORM icontains', self.measure(
+                lambda query: list(
+                    Ingredient.objects.filter(name__icontains=query)
+                ),
+                queries,
+                options['threads'],
+            ))
@@ -0,0 +1,152 @@
+import random
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.filters import RecipeFilter
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from users.models import Subscriptions, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими данными внутри транзакции, '
+        'сравнивает планы и время запросов RecipeFilter с индексами '
+        'и без них, затем откатывает все изменения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--per-user', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Печатать планы запросов.',
+        )
+
+    def seed(self, options):
+        batch_size = 5000
+        users = User.objects.bulk_create(
+            (
+                User(
+                    username=f'bench_user_{i}',
+                    email=f'bench_user_{i}@example.com',
+                    first_name='Bench',
+                    last_name='User',
+                )
+                for i in range(options['users'])
+            ),
+            batch_size=batch_size,
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'бенч{"а" * i}', color=f'#ABC{i:03d}', slug=f'bench{i}')
+            for i in range(3)
+        )
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    name=f'Рецепт {i}',
+                    author=random.choice(users),
+                    text='Синтетический рецепт',
+                    image='recipe_images/bench.png',
+                    cooking_time=random.randint(1, 120),
+                )
+                for i in range(options['recipes'])
+            ),
+            batch_size=batch_size,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe=recipe, tag=random.choice(tags))
+                for recipe in recipes
+            ),
+            batch_size=batch_size,
+        )
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                (
+                    model(user=user, recipe=recipe)
+                    for user in users
+                    for recipe in random.sample(recipes, options['per_user'])
+                ),
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+        Subscriptions.objects.bulk_create(
+            (
+                Subscriptions(user=user, author=author)
+                for user in users
+                for author in random.sample(users, 10)
+                if author != user
+            ),
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        return users, tags
+
+    def filtered(self, user, data):
+        """
+        Первая страница рецептов после RecipeFilter - тот же запрос,
+        что строит RecipeViewSet.
+        """
+        request = Request(APIRequestFactory().get('/api/recipes/', data))
+        request.user = user
+        filterset = RecipeFilter(
+            request.query_params, queryset=Recipe.objects.all(),
+            request=request,
+        )
+        if not filterset.is_valid():
+            raise CommandError(f'{data}: {filterset.errors}')
+        return filterset.qs[:6]
+
+    def hot_queries(self, user, tag):
+        return {
+            'Первая страница': self.filtered(user, {}),
+            'Рецепты автора': self.filtered(user, {'author': user.pk}),
+            'Избранное': self.filtered(user, {'is_favorited': 1}),
+            'Список покупок': self.filtered(
+                user, {'is_in_shopping_cart': 1}
+            ),
+            'По тегу': self.filtered(user, {'tags': tag.slug}),
+            'Подписки': User.objects.filter(subscribers__user=user)[:6],
+        }
+
+    def measure(self, queries, options, title):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = perf_counter()
+                list(queryset.all())
+                timings.append(perf_counter() - started)
+            self.stdout.write(f'{name}: {median(timings) * 1000:.2f} мс')
+            if options['explain']:
+                self.stdout.write(queryset.explain())
+
+    def indexes(self):
+        for model in (Recipe, Favorite, ShoppingCart, Subscriptions):
+            yield from model._meta.indexes
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users, tags = self.seed(options)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            queries = self.hot_queries(random.choice(users), tags[0])
+
+            self.measure(queries, options, 'С индексами')
+            with connection.cursor() as cursor:
+                for index in self.indexes():
+                    cursor.execute(
+                        f'DROP INDEX {connection.ops.quote_name(index.name)}'
+                    )
+            self.measure(queries, options, 'Без индексов')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,124 @@
+import random
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.fast_serializers import (FastIngredientSerializer,
+                                  FastRecipeSerializer)
+from api.renderers import FastJSONRenderer
+from api.serializers import IngredientSerializer, RecipeSerializer
+from api.views import RecipeViewSet
+from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время сериализации и рендеринга списка рецептов '
+        'и ингредиентов стандартными и быстрыми сериализаторами. '
+        'Данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def seed(self, options):
+        users = User.objects.bulk_create(
+            User(
+                username=f'bench_user_{i}',
+                email=f'bench_user_{i}@example.com',
+                first_name='Bench',
+                last_name='User',
+            )
+            for i in range(10)
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'бенч{"а" * i}', color=f'#ABC{i:03d}', slug=f'bench{i}')
+            for i in range(3)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'бенч {i}', measurement_unit='г')
+            for i in range(options['ingredients'])
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {i}',
+                author=random.choice(users),
+                text='Синтетический рецепт ' * 20,
+                image='recipe_images/bench.png',
+                cooking_time=random.randint(1, 120),
+            )
+            for i in range(options['recipes'])
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in random.sample(tags, 2)
+        )
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(recipe=recipe, ingredient=ingredient, amount=5)
+            for recipe in recipes
+            for ingredient in random.sample(
+                ingredients, options['per_recipe']
+            )
+        )
+        return users[0]
+
+    def measure(self, name, serializer, renderer, instances, context, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = perf_counter()
+            renderer.render(
+                serializer(instances, many=True, context=context).data
+            )
+            timings.append(perf_counter() - started)
+        result = median(timings)
+        self.stdout.write(f'{name}: {result * 1000:.2f} мс')
+        return result
+
+    def compare(self, title, standard, fast):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        slow_time = self.measure(*standard)
+        fast_time = self.measure(*fast)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: {slow_time / fast_time:.1f}x'
+        ))
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.seed(options)
+            request = Request(APIRequestFactory().get('/api/recipes/'))
+            request.user = user
+            view = RecipeViewSet(
+                request=request, action='list', format_kwarg=None, kwargs={}
+            )
+            context = {'request': request, 'view': view, 'format': None}
+            recipes = list(view.get_queryset())
+            ingredients = list(Ingredient.objects.all())
+            repeat = options['repeat']
+
+            self.compare(
+                f'Рецепты ({len(recipes)})',
+                ('RecipeSerializer + JSONRenderer', RecipeSerializer,
+                 JSONRenderer(), recipes, context, repeat),
+                ('FastRecipeSerializer + FastJSONRenderer',
+                 FastRecipeSerializer, FastJSONRenderer(), recipes,
+                 context, repeat),
+            )
+            self.compare(
+                f'Ингредиенты ({len(ingredients)})',
+                ('IngredientSerializer + JSONRenderer', IngredientSerializer,
+                 JSONRenderer(), ingredients, context, repeat),
+                ('FastIngredientSerializer + FastJSONRenderer',
+                 FastIngredientSerializer, FastJSONRenderer(), ingredients,
+                 context, repeat),
+            )
+            transaction.set_rollback(True)
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from core.catalog import export_recipes
+
+
+class Command(BaseCommand):
+    help = 'Выгружает все рецепты в NDJSON (по рецепту на строку).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            type=Path,
+            help='Файл для выгрузки, по умолчанию stdout.',
+        )
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        lines = export_recipes(options['chunk_size'])
+        if options['path'] is None:
+            sys.stdout.writelines(lines)
+            return
+        with options['path'].open('w', encoding='utf-8') as file:
+            file.writelines(lines)
+        self.stdout.write(self.style.SUCCESS(
+            f'Каталог выгружен в {options["path"]}'
+        ))
@@ -0,0 +1,43 @@
+import json
+import sys
+from operator import itemgetter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.catalog import CatalogImport
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из NDJSON пакетами. Строки с ошибками '
+        'пропускаются и выводятся с номерами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            type=Path,
+            help='Файл NDJSON или - для чтения из stdin.',
+        )
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        catalog = CatalogImport(options['batch_size'])
+        path = options['path']
+        if str(path) == '-':
+            catalog.run(sys.stdin)
+        elif not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        else:
+            with path.open(encoding='utf-8') as file:
+                catalog.run(file)
+
+        for number, error in sorted(catalog.errors, key=itemgetter(0)):
+            if not isinstance(error, str):
+                error = json.dumps(error, ensure_ascii=False)
+            self.stderr.write(f'Строка {number}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено рецептов: {catalog.created}, '
+            f'ошибок: {len(catalog.errors)}'
+        ))
@@ -0,0 +1,119 @@
+import csv
+import json
+from io import StringIO
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.cache import reference_cache
+from recipes.models import Ingredient
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0].strip(), row[1].strip()
+
+
+def iter_json(file, chunk_size=64 * 1024):
+    """
+    Читает JSON-массив объектов по частям, не загружая файл целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+    while True:
+        chunk = file.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[], \r\n\t':
+                position += 1
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'].strip(), item['measurement_unit'].strip()
+        if not chunk:
+            return
+
+
+READERS = {
+    '.csv': iter_csv,
+    '.json': iter_json,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV или JSON пакетами. '
+        'Повторная загрузка не создаёт дубликатов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=Path)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(path.suffix)
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+
+        write_batch = (
+            self.copy_batch if connection.vendor == 'postgresql'
+            else self.bulk_create_batch
+        )
+        before = Ingredient.objects.count()
+        processed = 0
+
+        with path.open(encoding='utf-8') as file, transaction.atomic():
+            rows = reader(file)
+            while batch := list(islice(rows, options['batch_size'])):
+                write_batch(batch)
+                processed += len(batch)
+                self.stdout.write(f'Обработано строк: {processed}')
+
+        reference_cache.bump('ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: обработано {processed}, '
+            f'добавлено {Ingredient.objects.count() - before}'
+        ))
+
+    def bulk_create_batch(self, batch):
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ),
+            ignore_conflicts=True,
+        )
+
+    def copy_batch(self, batch):
+        """
+        COPY во временную таблицу и перенос строк одним INSERT,
+        конфликты по unique_for_ingredient пропускаются.
+        """
+        buffer = StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredients_import '
+                '(name varchar, measurement_unit varchar) ON COMMIT DROP'
+            )
+            cursor.execute('TRUNCATE ingredients_import')
+            cursor.copy_expert(
+                'COPY ingredients_import FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredients_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
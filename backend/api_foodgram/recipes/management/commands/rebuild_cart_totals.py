@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Sum
+
+from recipes.models import AmountIngredient, CartIngredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает итоги списков покупок (CartIngredient) '
+        'по текущему содержимому корзин или сверяет их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить таблицу с актуальными данными.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+        )
+
+    def live_totals(self):
+        rows = AmountIngredient.objects.filter(
+            recipe__in_carts__isnull=False
+        ).values(
+            'ingredient_id',
+            user_id=F('recipe__in_carts__user'),
+        ).annotate(
+            total=Sum('amount')
+        ).order_by()
+        return {
+            (row['user_id'], row['ingredient_id']): row['total']
+            for row in rows.iterator()
+        }
+
+    def handle(self, *args, **options):
+        live = self.live_totals()
+
+        if options['verify']:
+            stored = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount
+                in CartIngredient.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount'
+                ).iterator()
+            }
+            mismatches = [
+                (key, stored.get(key), live.get(key))
+                for key in stored.keys() | live.keys()
+                if stored.get(key) != live.get(key)
+            ]
+            for (user_id, ingredient_id), got, expected in mismatches:
+                self.stdout.write(
+                    f'user={user_id} ingredient={ingredient_id}: '
+                    f'{got} != {expected}'
+                )
+            if mismatches:
+                raise CommandError(f'Расхождений: {len(mismatches)}')
+            self.stdout.write(self.style.SUCCESS('Итоги совпадают.'))
+            return
+
+        with transaction.atomic():
+            CartIngredient.objects.all().delete()
+            CartIngredient.objects.bulk_create(
+                (
+                    CartIngredient(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for (user_id, ingredient_id), amount in live.items()
+                ),
+                batch_size=options['batch_size'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано строк: {len(live)}'
+        ))
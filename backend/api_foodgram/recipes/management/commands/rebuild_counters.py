@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+
+from core.cache import recipe_cache
+from core.counters import count_of, recount
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscriptions, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscriptions, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики рецептов '
+        'и пользователей или сверяет их с актуальными данными.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить счётчики с актуальными данными.',
+        )
+
+    def verify(self):
+        mismatches = 0
+        for model, field, related, lookup in COUNTERS:
+            rows = model.objects.annotate(
+                actual=count_of(related, lookup)
+            ).filter(
+                ~Q(**{field: F('actual')})
+            ).values_list('pk', field, 'actual')
+            for pk, got, expected in rows.iterator():
+                mismatches += 1
+                self.stdout.write(
+                    f'{model.__name__}({pk}).{field}: {got} != {expected}'
+                )
+        if mismatches:
+            raise CommandError(f'Расхождений: {mismatches}')
+        self.stdout.write(self.style.SUCCESS('Счётчики совпадают.'))
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+            return
+
+        with transaction.atomic():
+            for model, field, related, lookup in COUNTERS:
+                updated = recount(
+                    model.objects.all(), field, related, lookup
+                )
+                self.stdout.write(f'{model.__name__}.{field}: {updated}')
+                if model is Recipe:
+                    recipe_cache.bump_on_commit(f'counter:{field}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
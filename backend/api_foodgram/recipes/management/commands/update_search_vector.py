@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.search import update_search_vector
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Заполняет поисковый вектор рецептов (только PostgreSQL).'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(
+                'Поисковый вектор используется только в PostgreSQL.'
+            )
+            return
+        update_search_vector(Recipe.objects.all())
+        self.stdout.write(self.style.SUCCESS('Поисковый вектор обновлён.'))
@@ -0,0 +1,30 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from core.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинг популярных рецептов. Запускается по cron '
+        'или с --interval как фоновый процесс.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Пересчитывать каждые N секунд, не завершаясь.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = update_trending()
+            self.stdout.write(self.style.SUCCESS(
+                f'Популярных рецептов: {count}'
+            ))
+            if not options['interval']:
+                return
+            sleep(options['interval'])
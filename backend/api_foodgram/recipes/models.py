@@ -1,19 +1,30 @@
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
 from django.db.models import (CASCADE, SET_NULL, CharField, CheckConstraint,
-                              DateTimeField, ForeignKey, ImageField,
-                              SlugField, ManyToManyField, Model,
+                              DateTimeField, FloatField, ForeignKey,
+                              ImageField, Index, SlugField, ManyToManyField,
+                              Model, OneToOneField, PositiveIntegerField,
                               PositiveSmallIntegerField, Q, TextField,
                               UniqueConstraint)
+from django.db import transaction
 from django.db.models.functions import Length
-from PIL import Image
 
-from core.enums import Tuples
+from core.counters import CounterFieldsMixin
+from core.images import schedule_image_processing
 from users.models import User
 
 CharField.register_lookup(Length)
 
+# GIN-индекс есть только в PostgreSQL, на других базах поиск
+# работает через резервный индекс в памяти (core.search).
+SEARCH_INDEXES = (
+    (GinIndex(fields=('search_vector',), name='recipe_search_vector_idx'),)
+    if 'postgresql' in settings.DATABASES['default']['ENGINE'] else ()
+)
+
 
 class Tag(Model):
     name = CharField(
@@ -88,7 +99,9 @@ class Ingredient(Model):
         return f'{self.name} {self.measurement_unit}'
 
 
-class Recipe(Model):
+class Recipe(CounterFieldsMixin, Model):
+    counter_fields = ('favorites_count', 'carts_count')
+
     name = CharField(
         verbose_name='Название блюда',
         max_length=settings.MAX_LEN_RECIPES_CHARFIELD,
@@ -114,6 +127,12 @@ class Recipe(Model):
         verbose_name='Изображение блюда',
         upload_to='recipe_images/',
     )
+    image_digest = CharField(
+        verbose_name='sha256 загруженного изображения',
+        max_length=64,
+        blank=True,
+        editable=False,
+    )
     text = TextField(
         verbose_name='Описание блюда',
         max_length=settings.MAX_LEN_RECIPES_TEXTFIELD,
@@ -132,11 +151,40 @@ class Recipe(Model):
             ),
         ),
     )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    favorites_count = PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    carts_count = PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date', )
+        indexes = (
+            Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_idx',
+            ),
+            Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx',
+            ),
+            Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_favorites_count_idx',
+            ),
+        ) + SEARCH_INDEXES
         constraints = (
             UniqueConstraint(
                 fields=('name', 'author'),
@@ -151,11 +199,33 @@ class Recipe(Model):
     def __str__(self):
         return f'{self.name}. Автор: {self.author.username}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_search_source()
+        return instance
+
+    def remember_search_source(self) -> None:
+        # Отложенные поля не загружаются: их значение неизвестно.
+        self._search_source = (
+            self.__dict__.get('name'), self.__dict__.get('text')
+        )
+
+    def search_source_changed(self) -> bool:
+        """
+        Изменились ли name или text с загрузки или последнего
+        обновления поискового вектора.
+        """
+        loaded = getattr(self, '_search_source', (None, None))
+        return None in loaded or loaded != (self.name, self.text)
+
     def save(self, *args, **kwargs):
+        # Обрабатываем изображение только если загружен новый файл.
+        image_changed = bool(self.image) and not self.image._committed
         super().save(*args, **kwargs)
-        image = Image.open(self.image.path)
-        image = image.resize(Tuples.RECIPE_IMAGE_SIZE)
-        image.save(self.image.path)
+        if image_changed:
+            path = self.image.path
+            transaction.on_commit(lambda: schedule_image_processing(path))
 
 
 class AmountIngredient(Model):
@@ -219,6 +289,16 @@ class Favorite(Model):
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        indexes = (
+            Index(
+                fields=('user', 'recipe'),
+                name='favorite_user_recipe_idx',
+            ),
+            Index(
+                fields=('date_added',),
+                name='favorite_date_added_idx',
+            ),
+        )
         constraints = (
             UniqueConstraint(
                 fields=('recipe', 'user', ),
@@ -252,6 +332,16 @@ class ShoppingCart(Model):
     class Meta:
         verbose_name = 'Рецепт в списке покупок'
         verbose_name_plural = 'Рецепты в списке покупок'
+        indexes = (
+            Index(
+                fields=('user', 'recipe'),
+                name='cart_user_recipe_idx',
+            ),
+            Index(
+                fields=('date_added',),
+                name='cart_date_added_idx',
+            ),
+        )
         constraints = (
             UniqueConstraint(
                 fields=('recipe', 'user', ),
@@ -261,3 +351,71 @@ class ShoppingCart(Model):
 
     def __str__(self):
         return f'{self.user} -> {self.recipe}'
+
+
+class CartIngredient(Model):
+    """
+    Денормализованные итоги списка покупок: сколько каждого ингредиента
+    нужно пользователю по всем рецептам в его корзине.
+    Поддерживается инкрементально, см. core.services.change_cart_totals.
+    """
+    user = ForeignKey(
+        User,
+        verbose_name='Владелец списка',
+        related_name='+',
+        on_delete=CASCADE,
+    )
+    ingredient = ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='+',
+        on_delete=CASCADE,
+    )
+    amount = PositiveIntegerField(
+        verbose_name='Суммарное количество',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = (
+            UniqueConstraint(
+                fields=('user', 'ingredient', ),
+                name='\n%(app_label)s_%(class)s ingredient alredy counted\n',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user} -> {self.amount} {self.ingredient}'
+
+
+class TrendingScore(Model):
+    """
+    Рейтинг популярности рецепта с затуханием по времени.
+    Пересчитывается командой update_trending, в таблице хранятся
+    только TRENDING_TOP_K лучших рецептов.
+    """
+    recipe = OneToOneField(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='trending',
+        on_delete=CASCADE,
+        primary_key=True,
+    )
+    score = FloatField(
+        verbose_name='Рейтинг',
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Популярные рецепты'
+        indexes = (
+            Index(
+                fields=('-score',),
+                name='trending_score_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.score:.3f}'
@@ -1,10 +1,12 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db.models import (CASCADE, CharField, CheckConstraint,
-                              DateTimeField, EmailField, F, ForeignKey, Model,
-                              Q, UniqueConstraint)
+                              DateTimeField, EmailField, F, ForeignKey, Index,
+                              Model, PositiveIntegerField, Q,
+                              UniqueConstraint)
 from django.db.models.functions import Length
 
+from core.counters import CounterFieldsMixin
 from core.validators import UserFieldsValidator
 
 CharField.register_lookup(Length)
@@ -61,7 +63,9 @@ class CustomUserManager(BaseUserManager):
         )
 
 
-class User(AbstractUser):
+class User(CounterFieldsMixin, AbstractUser):
+    counter_fields = ('recipes_count', 'subscribers_count')
+
     email = EmailField(
         verbose_name='Адрес электронной почты',
         max_length=settings.MAX_LEN_EMAIL_FIELD,
@@ -91,6 +95,16 @@ class User(AbstractUser):
             field='Фамилия'),
         ),
     )
+    recipes_count = PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False,
+    )
+    subscribers_count = PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False,
+    )
 
     objects = CustomUserManager()
 
@@ -128,6 +142,12 @@ class Subscriptions(Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        indexes = (
+            Index(
+                fields=('user', 'author'),
+                name='subscription_user_author_idx',
+            ),
+        )
         constraints = (
             UniqueConstraint(
                 fields=('author', 'user'),